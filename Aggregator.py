@@ -0,0 +1,64 @@
+import numpy as np
+from Portfolio import Portfolio
+from Valuation import Valuation
+
+
+class Aggregator:
+    # Values many portfolios, possibly of different users, together. Every distinct instrument is
+    # priced once for all of them and the exposure is consolidated by market, currency and symbol.
+    def __init__(self, portfolios=None):
+        self.portfolios = []  # (User, portfolio name) pairs
+        for user, p_name in portfolios or []:
+            self.add(user, p_name)
+
+    def add(self, user, p_name):
+        self.portfolios.append((user, p_name))
+
+    def valuate(self, currency="TRY"):
+        # Load the holdings of every portfolio, one Portfolio object per User database
+        loaders = {}
+        rows = []
+        slices = []  # Position of each portfolio's rows in the combined row list
+        for user, p_name in self.portfolios:
+            if id(user) not in loaders:
+                loaders[id(user)] = Portfolio(user)
+            start = len(rows)
+            rows.extend(loaders[id(user)].holdings(p_name))
+            slices.append((start, len(rows)))
+
+        # One batch request for the distinct instruments and one rate per holding currency into the reporting currency
+        prices = Portfolio.get_prices([(row[0], row[5]) for row in rows])
+        rates = {}
+        if loaders:
+            rates = next(iter(loaders.values())).fx.rates_to(currency, [row[4] for row in rows] + ["USD"])
+
+        # Per portfolio results in the same shape as Portfolio.portfolio_infos
+        results = {}
+        for (user, p_name), (start, end) in zip(self.portfolios, slices):
+            results[(user.user, p_name)] = Valuation(rows[start:end], prices, rates=rates, currency=currency).to_infos()
+
+        # Consolidated exposure in the reporting currency over every position at once
+        valuation = Valuation(rows, prices, rates=rates, currency=currency)
+        total = {
+            "currency": currency,
+            "portfolio_value": round(valuation.portfolio_value, 2),
+            "total_profit": round(valuation.total_profit, 2),
+            "markets": Aggregator.group([row[5] for row in rows], valuation),
+            "currencies": Aggregator.group([row[4] for row in rows], valuation),
+            "symbols": Aggregator.group([row[0] for row in rows], valuation),
+        }
+        return {"portfolios": results, "total": total}
+
+    @staticmethod
+    def group(keys, valuation):
+        # Sum value, profit and quantity per key and add the key's weight in the consolidated value
+        names, codes = np.unique(np.array(keys, dtype=str), return_inverse=True)
+        value = np.bincount(codes, weights=valuation.value_try, minlength=len(names))
+        profit = np.bincount(codes, weights=valuation.profit_try, minlength=len(names))
+        quantity = np.bincount(codes, weights=valuation.quantity, minlength=len(names))
+        groups = {}
+        for name, value_, profit_, quantity_ in zip(names.tolist(), value.tolist(), profit.tolist(), quantity.tolist()):
+            percentage = value_ / valuation.portfolio_value * 100 if valuation.portfolio_value > 0 else 0.0
+            groups[name] = {"value": round(value_, 2), "profit": round(profit_, 2), "quantity": quantity_,
+                            "portfolio_percentage": round(percentage, 2)}
+        return groups
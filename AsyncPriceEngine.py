@@ -0,0 +1,161 @@
+from contextlib import nullcontext
+import asyncio
+import time
+
+
+class TokenBucket:
+    # Rate limit: at most rate requests per second on average, with bursts of up to capacity requests
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncPriceProvider:
+    # Base class for async price sources, source names the data source the limits are applied to
+    source = "default"
+
+    async def get_price(self, yf_symbol):
+        raise NotImplementedError
+
+    async def get_info(self, yf_symbol):
+        raise NotImplementedError
+
+
+class ThreadedPriceProvider(AsyncPriceProvider):
+    # Runs a synchronous PriceProvider in worker threads, so existing sources can be used from asyncio
+    def __init__(self, provider, source="yfinance"):
+        self.provider = provider
+        self.source = source
+
+    async def get_price(self, yf_symbol):
+        return await asyncio.to_thread(self.provider.get_price, yf_symbol)
+
+    async def get_info(self, yf_symbol):
+        return await asyncio.to_thread(self.provider.get_info, yf_symbol)
+
+
+class LocalAsyncPriceProvider(AsyncPriceProvider):
+    # Offline source backed by a dictionary, latency (seconds) is added to every request to simulate the network
+    def __init__(self, prices=None, infos=None, latency=0.0, source="local"):
+        self.prices = prices or {}
+        self.infos = infos or {}
+        self.latency = latency
+        self.source = source
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0  # Highest number of concurrent requests seen, so tests can check the cap
+
+    async def get_price(self, yf_symbol):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return self.prices[yf_symbol]
+        finally:
+            self.in_flight -= 1
+
+    async def get_info(self, yf_symbol):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.infos.get(yf_symbol, {})
+
+
+class AsyncPriceEngine:
+    # Fetches quotes concurrently with a concurrency cap and an optional token-bucket rate limit per source.
+    # Concurrent requests for the same symbol share one network call.
+    def __init__(self, provider, get_extension, max_concurrency=8, rate=None, burst=None, cache=None):
+        self.provider = provider
+        self.get_extension = get_extension  # Callable market -> yfinance symbol extension
+        self.max_concurrency = max_concurrency
+        self.rate = rate  # Requests per second per source, None for no limit
+        self.burst = burst
+        self.cache = cache  # Optional QuoteCache shared with the synchronous Portfolio methods
+        self.loop = None
+        self.limits = {}  # source -> (semaphore, token bucket)
+        self.in_flight = {}  # cache key -> future of the running request
+
+    def reset(self):
+        # asyncio primitives belong to one event loop, recreate them when a new loop is used
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.limits = {}
+            self.in_flight = {}
+
+    def limit(self, source):
+        if source not in self.limits:
+            bucket = TokenBucket(self.rate, self.burst) if self.rate else None
+            self.limits[source] = (asyncio.Semaphore(self.max_concurrency), bucket)
+        return self.limits[source]
+
+    async def get_price(self, symbol, stockmarket):
+        # Latest price rounded to 2 decimals, like Portfolio.get_prices
+        return await self.fetch(("price", symbol, stockmarket, None), f"{symbol}{self.get_extension(stockmarket)}", 2)
+
+    async def get_rate(self, currency):
+        # Latest units per USD of a currency, not rounded and under the cache key of Portfolio.get_rates
+        return await self.fetch(("fx", currency, None), f"{currency}{self.get_extension("Foreign Currency")}", None)
+
+    async def fetch(self, key, yf_symbol, digits):
+        self.reset()
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        if key in self.in_flight:
+            return await asyncio.shield(self.in_flight[key])  # Join the request already running for this symbol
+
+        future = self.loop.create_future()
+        self.in_flight[key] = future
+        try:
+            semaphore, bucket = self.limit(self.provider.source)
+            async with semaphore:
+                if bucket:
+                    await bucket.acquire()
+                price = await self.provider.get_price(yf_symbol)
+            if digits is not None:
+                price = round(price, digits)
+            if self.cache:
+                self.cache.set(key, price)
+            future.set_result(price)
+            return price
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            future.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            del self.in_flight[key]
+
+    async def get_prices(self, pairs):
+        # Fetch many (symbol, market) pairs concurrently, returns {(symbol, market): price}
+        pairs = list(dict.fromkeys(pairs))
+        with self.cache.batch() if self.cache else nullcontext():  # Quotes of this batch are not evicted by the rest of it
+            prices = await asyncio.gather(*(self.get_price(symbol, market) for symbol, market in pairs))
+        return dict(zip(pairs, prices))
+
+    async def get_rates(self, currencies):
+        # {currency: units per USD} fetched concurrently, currencies without a quote are left out
+        currencies = list(dict.fromkeys(currencies))
+        rates = await asyncio.gather(*(self.get_rate(currency) for currency in currencies), return_exceptions=True)
+        return {currency: rate for currency, rate in zip(currencies, rates) if not isinstance(rate, Exception)}
+
+    def get_prices_sync(self, pairs):
+        # Synchronous wrapper for callers outside of asyncio
+        return asyncio.run(self.get_prices(pairs))
@@ -0,0 +1,135 @@
+from _datetime import datetime, timedelta
+
+
+class FX:
+    # Exchange rates between any two currencies. Only one base pair per currency is downloaded (TRY=X is TRY per USD),
+    # every cross rate (EUR/TRY, GBP/EUR, ...) comes from an in-memory matrix built from those base rates.
+    # Daily rates are read from the price_history table, so each past day is downloaded only once.
+    base = "USD"
+    signs = {"TRY": "₺", "USD": "$", "EUR": "€", "GBP": "£"}
+
+    def __init__(self, history, fetch_rates, currencies=("USD", "TRY")):
+        self.history = history  # PriceHistory holding the daily closes of the base pairs
+        self.fetch_rates = fetch_rates  # Callable currencies -> {currency: units per USD}, latest quotes
+        self.currencies = []
+        self.index = {}  # currency -> row and column of the matrices
+        self.matrices = {}  # date -> matrix, matrix[i][j] is the units of currency j for one unit of currency i
+        self.latest = None  # (base rates, matrix) of the latest quotes
+        self.unpriced = set()  # Currencies without a base pair (e.g. "Unknown"), their amounts are not converted
+        self.add(currencies)
+
+    def add(self, currencies):
+        # Extend the matrices with new currencies, they are rebuilt on the next request
+        new = [currency for currency in dict.fromkeys(currencies) if currency not in self.index]
+        for currency in new:
+            self.index[currency] = len(self.currencies)
+            self.currencies.append(currency)
+        if new:
+            self.matrices = {}
+            self.latest = None
+
+    @staticmethod
+    def pair(currency):
+        # (symbol, market) of the base pair of a currency, quoted in units per USD
+        return (currency, "Foreign Currency")
+
+    def pairs(self, currencies=None):
+        return [FX.pair(currency) for currency in (currencies or self.currencies) if currency != FX.base and currency not in self.unpriced]
+
+    def quoted(self):
+        # Currencies whose latest base rate has to be fetched
+        return [currency for currency in self.currencies if currency != FX.base and currency not in self.unpriced]
+
+    def no_rate(self, currency):
+        if currency not in self.unpriced:
+            self.unpriced.add(currency)
+            print(f"No exchange rate found for {currency}, its amounts are not converted.")
+
+    @staticmethod
+    def build(per_usd):
+        # Cross rate of every currency pair from the units per USD of each currency
+        return [[to / source for to in per_usd] for source in per_usd]
+
+    def matrix(self, date=None, quotes=None):
+        # Rate matrix of the latest quotes, or of the closes on a day. quotes: latest {currency: units per USD}
+        # already fetched by the caller (e.g. the async price engine), instead of calling fetch_rates
+        if date is not None:
+            if date not in self.matrices:
+                self.preload(date, date)
+            return self.matrices[date]
+
+        rates = self.fetch_rates(self.quoted()) if quotes is None else quotes
+        for currency in self.currencies:
+            if currency != FX.base and currency not in rates:
+                self.no_rate(currency)
+        per_usd = tuple(rates.get(currency, 1.0) for currency in self.currencies)
+        if self.latest is None or self.latest[0] != per_usd:
+            self.latest = (per_usd, FX.build(per_usd))
+        return self.latest[1]
+
+    def preload(self, start, end, currencies=()):
+        # Build the matrices of every day between two dates with one history request for the base pairs
+        self.add(currencies)
+        lookback = (datetime.strptime(start, "%Y-%m-%d") - timedelta(days=15)).strftime("%Y-%m-%d")
+        pairs = self.pairs()
+        self.history.ensure(pairs, lookback, end)
+        self.fill(self.history.stored_closes(pairs, lookback, end), start, end)
+
+    def fill(self, closes, start, end):
+        # Build daily matrices from stored closes {(symbol, market): [(date, close), ...]}, e.g. read together with
+        # the closes of the holdings. Weekends and holidays use the previous close; days before the first close use it.
+        # A currency without any close in the period uses its latest quote, or is not converted without one.
+        series = []
+        for currency in self.currencies:
+            bars = closes.get(FX.pair(currency)) if currency != FX.base and currency not in self.unpriced else [(start, 1.0)]
+            if not bars:
+                latest = self.fetch_rates([currency])
+                if currency in latest:
+                    bars = [(start, latest[currency])]
+                else:
+                    self.no_rate(currency)
+                    bars = [(start, 1.0)]
+            series.append(bars)
+
+        per_usd = [bars[0][1] for bars in series]
+        next_bar = [0] * len(series)
+        matrix = None
+        day = datetime.strptime(start, "%Y-%m-%d").date()
+        last_day = datetime.strptime(end, "%Y-%m-%d").date()
+        while day <= last_day:
+            date = day.isoformat()
+            for i, bars in enumerate(series):
+                while next_bar[i] < len(bars) and bars[next_bar[i]][0] <= date:
+                    per_usd[i] = bars[next_bar[i]][1]
+                    next_bar[i] += 1
+                    matrix = None
+            if matrix is None:
+                matrix = FX.build(per_usd)  # Days without a new close share the matrix of the previous day
+            self.matrices[date] = matrix
+            day += timedelta(days=1)
+
+    def rate(self, source, target, date=None):
+        # Units of target for one unit of source, at the latest quotes or on a day
+        self.add((source, target))
+        matrix = self.matrix(date)
+        if source in self.unpriced or target in self.unpriced:
+            return 1.0
+        return matrix[self.index[source]][self.index[target]]
+
+    def rates_to(self, target, currencies, date=None, quotes=None):
+        # {currency: units of target for one unit of currency} for many currencies from a single matrix
+        currencies = list(dict.fromkeys(currencies))
+        self.add(currencies + [target])
+        matrix = self.matrix(date, quotes)
+        column = self.index[target]
+        return {currency: 1.0 if currency in self.unpriced or target in self.unpriced else matrix[self.index[currency]][column]
+                for currency in currencies}
+
+    def convert(self, amounts, target, date=None):
+        # Total of many (amount, currency) pairs in target. Amounts are summed per currency first,
+        # so every currency group is converted with a single multiplication.
+        totals = {}
+        for amount, currency in amounts:
+            totals[currency] = totals.get(currency, 0.0) + amount
+        rates = self.rates_to(target, totals, date)
+        return sum(total * rates[currency] for currency, total in totals.items())
@@ -0,0 +1,120 @@
+from collections import deque
+import sqlite3 as sql
+import functools
+import threading
+import json
+import time
+
+
+class Instrumentation:
+    # Opt-in timing of the hot paths: call counts, latency histograms and, optionally, a call tree per report.
+    # When disabled every instrumented call only pays one attribute check.
+    buckets = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000]  # Histogram upper bounds in milliseconds
+
+    def __init__(self):
+        self.enabled = False
+        self.tracing = False
+        self.lock = threading.Lock()
+        self.local = threading.local()  # Stack of open trace nodes per thread
+        self.gauges = {}  # name -> callable returning a dict, e.g. cache statistics
+        self.reset()
+
+    def enable(self, trace=False):
+        self.enabled = True
+        self.tracing = trace
+
+    def disable(self):
+        self.enabled = False
+        self.tracing = False
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}  # name -> [count, total ms, max ms, histogram counts]
+            self.traces = deque(maxlen=20)  # Most recent report trees
+
+    def register(self, name, gauge):
+        self.gauges[name] = gauge
+
+    def record(self, name, milliseconds):
+        with self.lock:
+            stats = self.calls.get(name)
+            if stats is None:
+                stats = self.calls[name] = [0, 0.0, 0.0, [0] * (len(Instrumentation.buckets) + 1)]
+            stats[0] += 1
+            stats[1] += milliseconds
+            stats[2] = max(stats[2], milliseconds)
+            bucket = next((index for index, bound in enumerate(Instrumentation.buckets) if milliseconds <= bound),
+                          len(Instrumentation.buckets))
+            stats[3][bucket] += 1
+
+    def call(self, name, function, *args, **kwargs):
+        # Run function, recording its latency under name and adding it to the current trace tree
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+
+        node = None
+        if self.tracing:
+            node = {"name": name, "ms": 0.0, "children": []}
+            if stack:
+                stack[-1]["children"].append(node)
+            stack.append(node)
+
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            milliseconds = (time.perf_counter() - start) * 1000
+            self.record(name, milliseconds)
+            if node is not None:
+                node["ms"] = round(milliseconds, 3)
+                stack.pop()
+                if not stack:
+                    self.traces.append(node)
+
+    def snapshot(self):
+        # Current statistics as a plain dictionary
+        labels = [f"<={bound}ms" for bound in Instrumentation.buckets] + [f">{Instrumentation.buckets[-1]}ms"]
+        with self.lock:
+            calls = {name: {"count": count,
+                            "total_ms": round(total, 3),
+                            "mean_ms": round(total / count, 3),
+                            "max_ms": round(maximum, 3),
+                            "histogram": {label: hits for label, hits in zip(labels, histogram) if hits}}
+                     for name, (count, total, maximum, histogram) in self.calls.items()}
+            traces = list(self.traces)
+        return {"enabled": self.enabled,
+                "calls": calls,
+                "gauges": {name: gauge() for name, gauge in self.gauges.items()},
+                "traces": traces}
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent, ensure_ascii=False)
+
+
+instrumentation = Instrumentation()  # Shared by User, Portfolio and the cursors they create
+
+
+def timed(name):
+    # Decorator recording the calls of a function under name while instrumentation is enabled
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return function(*args, **kwargs)
+            return instrumentation.call(name, function, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracedCursor(sql.Cursor):
+    # sqlite3 cursor recording every execute under "sql.<STATEMENT>" while instrumentation is enabled
+    def execute(self, statement, parameters=()):
+        if not instrumentation.enabled:
+            return super().execute(statement, parameters)
+        return instrumentation.call(f"sql.{statement.split(None, 1)[0].upper()}", super().execute, statement, parameters)
+
+    def executemany(self, statement, parameters):
+        if not instrumentation.enabled:
+            return super().executemany(statement, parameters)
+        return instrumentation.call(f"sql.{statement.split(None, 1)[0].upper()}_MANY", super().executemany, statement, parameters)
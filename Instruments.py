@@ -0,0 +1,54 @@
+from _datetime import datetime
+
+
+class Instruments:
+    # Instrument master table: name, exchange and currency of every symbol seen in this database.
+    # Rows are filled on first use and read locally afterwards, refresh() downloads them again.
+    def __init__(self, user, fetch_info):
+        self.user = user
+        self.conn = user.conn
+        self.cursor = user.cursor
+        self.fetch_info = fetch_info  # Callable (symbol, market, use_cache) -> stock info dict
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS instruments ("
+                            "symbol TEXT, "  # Stock symbol
+                            "market TEXT, "  # Market name (e.g., BIST)
+                            "yf_symbol TEXT, "  # Symbol with the yfinance extension (e.g., THYAO.IS)
+                            "long_name TEXT, "  # Company name
+                            "exchange TEXT, "  # Exchange name resolved from yfinance
+                            "currency TEXT, "  # Trading currency (e.g., USD, TRY)
+                            "last_refreshed TEXT, "  # When the row was last downloaded
+                            "PRIMARY KEY (symbol, market))")
+
+    def get(self, symbol, stockmarket):
+        # Return the stock information of a symbol, downloading it only if it is not in the table yet
+        self.cursor.execute("SELECT long_name, exchange, currency, yf_symbol FROM instruments WHERE symbol = ? AND market = ?",
+                            (symbol, stockmarket))
+        row = self.cursor.fetchone()
+        if row:
+            return {"company_name": row[0], "exchange": row[1], "currency": row[2], "yf_symbol": row[3]}
+
+        infos = self.fetch_info(symbol, stockmarket, True)
+        with self.user.transaction():
+            return self.save(symbol, stockmarket, infos)
+
+    def refresh(self, symbol=None, stockmarket=None):
+        # Download the stored information again, for one instrument or for all of them
+        if symbol:
+            instruments = [(symbol, stockmarket)]
+        else:
+            self.cursor.execute("SELECT symbol, market FROM instruments")
+            instruments = self.cursor.fetchall()
+
+        infos = [(symbol_, market, self.fetch_info(symbol_, market, False)) for symbol_, market in instruments]
+        with self.user.transaction():
+            for symbol_, market, infos_ in infos:
+                self.save(symbol_, market, infos_)
+        print(f"{len(instruments)} instruments refreshed.")
+
+    def save(self, symbol, stockmarket, infos):
+        self.cursor.execute("INSERT OR REPLACE INTO instruments "
+                            "(symbol, market, yf_symbol, long_name, exchange, currency, last_refreshed) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (symbol, stockmarket, infos["yf_symbol"], infos["company_name"],
+                             infos["exchange"], infos["currency"], datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        return infos
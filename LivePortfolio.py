@@ -0,0 +1,123 @@
+from Valuation import Valuation
+
+
+class LivePortfolio:
+    # Long-lived in-memory model of one portfolio for live dashboards. A quote tick updates the position,
+    # its market total and the portfolio totals in O(1); weights and the full report are only rebuilt when read.
+    def __init__(self, portfolio, p_name, prices=None, currency="TRY"):
+        self.portfolio = portfolio
+        self.p_name = p_name
+        self.currency = currency  # Reporting currency of the totals and of infos()
+        self.positions = {}  # symbol -> [cost, quantity, exchange, market, last price]
+        self.market_totals = {market: [0.0, 0.0] for market in Valuation.markets}  # market -> [value, profit] in its own currency
+        self.currency_totals = {}  # currency -> [value, profit] of the holdings in that currency
+        self.usd_rates = {}  # currency -> USD per unit, updated by currency ticks
+        self.cached_infos = None  # Report built on the last read, cleared by every change
+
+        rows = portfolio.holdings(p_name)
+        if prices is None:
+            prices = portfolio.get_prices([(row[0], row[5]) for row in rows])
+        self.add_currencies([row[4] for row in rows] + [currency])
+        for symbol, name, cost, quantity, exchange, market in rows:
+            self.add(symbol, cost, quantity, exchange, market, prices[(symbol, market)])
+
+        portfolio.listeners.append(self.on_trade)  # Buys and sells recorded through the Portfolio update the model
+
+    def add_currencies(self, currencies):
+        # Latest USD rate of currencies not seen yet, from the Portfolio's FX
+        new = [currency for currency in dict.fromkeys(currencies) if currency not in self.usd_rates]
+        if new:
+            self.usd_rates.update(self.portfolio.fx.rates_to("USD", new))
+
+    def rates(self):
+        # {currency: units of the reporting currency for one unit of currency}
+        target = self.usd_rates[self.currency]
+        return {currency: rate / target for currency, rate in self.usd_rates.items()}
+
+    def add(self, symbol, cost, quantity, exchange, market, last_p):
+        self.add_currencies([exchange])
+        self.positions[symbol] = [cost, quantity, exchange, market, last_p]
+        self.move(symbol, quantity * last_p, (last_p - cost) * quantity)
+
+    def remove(self, symbol):
+        cost, quantity, exchange, market, last_p = self.positions.pop(symbol)
+        self.move(symbol, -quantity * last_p, -(last_p - cost) * quantity, exchange, market)
+
+    def move(self, symbol, value, profit, exchange=None, market=None):
+        # Add a value and profit change of one position to its market and currency totals
+        if exchange is None:
+            exchange, market = self.positions[symbol][2], self.positions[symbol][3]
+        market_totals = self.market_totals[market]
+        market_totals[0] += value
+        market_totals[1] += profit
+        currency_totals = self.currency_totals.setdefault(exchange, [0.0, 0.0])
+        currency_totals[0] += value
+        currency_totals[1] += profit
+        self.cached_infos = None
+
+    def apply_tick(self, symbol, price):
+        # Apply one quote update. A currency code updates its exchange rate, quoted like TRY=X in units per USD
+        position = self.positions.get(symbol)
+        if position is None and symbol in self.usd_rates and symbol != "USD":
+            self.usd_rates[symbol] = 1 / price
+            self.cached_infos = None
+            return
+
+        if position is None:
+            return  # Not held in this portfolio
+        change = (price - position[4]) * position[1]
+        position[4] = price
+        self.move(symbol, change, change)
+
+    def consume(self, feed):
+        # Apply ticks from any iterable of (symbol, price) pairs or from a queue, where None ends the feed
+        count = 0
+        if hasattr(feed, "get"):
+            feed = iter(feed.get, None)
+        for symbol, price in feed:
+            self.apply_tick(symbol, price)
+            count += 1
+        return count
+
+    def on_trade(self, p_name, symbol):
+        # Called after a buy or sell, re-reads only the changed holding
+        if p_name != self.p_name:
+            return
+        last_p = self.positions[symbol][4] if symbol in self.positions else None
+        if symbol in self.positions:
+            self.remove(symbol)
+
+        self.portfolio.cursor.execute("SELECT cost, quantity, exchange, market FROM holdings WHERE portfolio_id = ? AND symbol = ?",
+                                      (self.portfolio.portfolio_id(p_name), symbol))
+        row = self.portfolio.cursor.fetchone()
+        if row:
+            cost, quantity, exchange, market = row
+            self.add(symbol, cost, quantity, exchange, market, cost if last_p is None else last_p)  # A new symbol uses its cost until the first tick
+        self.cached_infos = None
+
+    def portfolio_value(self):
+        # Portfolio value in the reporting currency
+        rates = self.rates()
+        return sum(totals[0] * rates[currency] for currency, totals in self.currency_totals.items())
+
+    def total_profit(self):
+        rates = self.rates()
+        return sum(totals[1] * rates[currency] for currency, totals in self.currency_totals.items())
+
+    def market_total(self, market):
+        # Value and profit of one market in its own currency
+        return {"total": self.market_totals[market][0], "profit": self.market_totals[market][1]}
+
+    def infos(self):
+        # Full report in the shape of Portfolio.portfolio_infos, rebuilt only after something changed
+        if self.cached_infos is None:
+            rows = [(symbol, None, cost, quantity, exchange, market)
+                    for symbol, (cost, quantity, exchange, market, last_p) in self.positions.items()]
+            prices = {(symbol, position[3]): position[4] for symbol, position in self.positions.items()}
+            self.cached_infos = Valuation(rows, prices, rates=self.rates(), currency=self.currency).to_infos()
+        return self.cached_infos
+
+    def close(self):
+        # Stop following the trades of the Portfolio
+        if self.on_trade in self.portfolio.listeners:
+            self.portfolio.listeners.remove(self.on_trade)
@@ -0,0 +1,209 @@
+from array import array
+
+
+class OpenLots:
+    # Open lots of one symbol in compact arrays, oldest first. FIFO consumes from head, LIFO from the end.
+    def __init__(self):
+        self.lot_ids = array("q")
+        self.quantities = array("d")
+        self.costs = array("d")
+        self.head = 0  # Index of the oldest lot still open
+
+    def add(self, lot_id, quantity, cost):
+        self.lot_ids.append(lot_id)
+        self.quantities.append(quantity)
+        self.costs.append(cost)
+
+    def total_quantity(self):
+        return sum(self.quantities[self.head:])
+
+    def average_cost(self):
+        quantity = self.total_quantity()
+        if quantity <= 0:
+            return 0.0
+        return sum(q * c for q, c in zip(self.quantities[self.head:], self.costs[self.head:])) / quantity
+
+    def match(self, quantity, method):
+        # Take quantity out of the open lots, returns the cost basis of the taken part and the
+        # changed lots as (lot_id, remaining quantity) pairs
+        if method == "average":
+            cost_basis = self.average_cost() * quantity
+            remaining = self.total_quantity() - quantity
+            changes = [(lot_id, 0.0) for lot_id in self.lot_ids[self.head:]]
+            return cost_basis, changes, remaining
+
+        cost_basis = 0.0
+        changes = []
+        while quantity > 1e-12 and self.head < len(self.lot_ids):
+            index = self.head if method == "fifo" else len(self.lot_ids) - 1
+            taken = min(quantity, self.quantities[index])
+            cost_basis += taken * self.costs[index]
+            quantity -= taken
+            self.quantities[index] -= taken
+
+            if self.quantities[index] <= 1e-12:
+                changes.append((self.lot_ids[index], 0.0))
+                if method == "fifo":
+                    self.head += 1
+                else:
+                    self.lot_ids.pop()
+                    self.quantities.pop()
+                    self.costs.pop()
+            else:
+                changes.append((self.lot_ids[index], self.quantities[index]))
+
+        # Drop the consumed part of the arrays once it is the larger half
+        if self.head and self.head * 2 >= len(self.lot_ids):
+            self.lot_ids = self.lot_ids[self.head:]
+            self.quantities = self.quantities[self.head:]
+            self.costs = self.costs[self.head:]
+            self.head = 0
+        return cost_basis, changes, None
+
+    def reset(self, lot_id, quantity, cost):
+        # Replace every lot with a single one, used by the average-cost method
+        self.lot_ids = array("q", [lot_id] if quantity > 0 else [])
+        self.quantities = array("d", [quantity] if quantity > 0 else [])
+        self.costs = array("d", [cost] if quantity > 0 else [])
+        self.head = 0
+
+
+class Lots:
+    # Lot ledger: every buy opens a lot and every sell is matched against the open lots with the portfolio's
+    # FIFO, LIFO or average-cost method. The realized P/L is stored when the sell is recorded, so period
+    # and tax reports are indexed sums over the realized_pl table.
+    methods = ("fifo", "lifo", "average")
+
+    def __init__(self, user):
+        self.user = user
+        self.conn = user.conn
+        self.cursor = user.cursor
+        self.open_lots = user.open_lots  # (portfolio_id, symbol) -> OpenLots, loaded on first use and shared per connection
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS lots ("
+                            "lot_id INTEGER PRIMARY KEY, "
+                            "portfolio_id INTEGER, "
+                            "symbol TEXT, "
+                            "trade_id INTEGER, "  # Buy that opened the lot
+                            "date TEXT, "
+                            "quantity REAL, "  # Quantity still open
+                            "cost REAL)")  # Unit cost of the lot
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS lots_portfolio_symbol ON lots (portfolio_id, symbol)")
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS realized_pl ("
+                            "trade_id INTEGER PRIMARY KEY, "  # Sell that realized the profit
+                            "portfolio_id INTEGER, "
+                            "date TEXT, "
+                            "symbol TEXT, "
+                            "currency TEXT, "
+                            "quantity REAL, "
+                            "proceeds REAL, "  # Sale price * quantity
+                            "cost_basis REAL, "  # Cost of the matched lots
+                            "pl REAL)")  # proceeds - cost_basis
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS realized_pl_portfolio_date ON realized_pl (portfolio_id, date)")
+        # Matching method of every portfolio, a portfolio without a row has not been built from its trades yet
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS lot_methods ("
+                            "portfolio_id INTEGER PRIMARY KEY, "
+                            "method TEXT)")
+
+    def method(self, portfolio_id):
+        # Matching method of a portfolio, building its lots from the trade history the first time
+        self.cursor.execute("SELECT method FROM lot_methods WHERE portfolio_id = ?", (portfolio_id,))
+        row = self.cursor.fetchone()
+        if row:
+            return row[0]
+        self.rebuild(portfolio_id, "average")
+        return "average"
+
+    def set_method(self, portfolio_id, method):
+        # Change the matching method and recompute every lot and realized P/L of the portfolio
+        if method not in Lots.methods:
+            raise ValueError(f"Unknown cost method {method}, choose one of {', '.join(Lots.methods)}")
+        self.rebuild(portfolio_id, method)
+
+    def get(self, portfolio_id, symbol):
+        key = (portfolio_id, symbol)
+        if key not in self.open_lots:
+            lots = OpenLots()
+            self.cursor.execute("SELECT lot_id, quantity, cost FROM lots WHERE portfolio_id = ? AND symbol = ? ORDER BY lot_id",
+                                (portfolio_id, symbol))
+            for lot_id, quantity, cost in self.cursor.fetchall():
+                lots.add(lot_id, quantity, cost)
+            self.open_lots[key] = lots
+        return self.open_lots[key]
+
+    def buy(self, portfolio_id, symbol, trade_id, date, cost, quantity):
+        self.method(portfolio_id)
+        lots = self.get(portfolio_id, symbol)
+        self.cursor.execute("INSERT INTO lots (portfolio_id, symbol, trade_id, date, quantity, cost) VALUES (?, ?, ?, ?, ?, ?)",
+                            (portfolio_id, symbol, trade_id, date, quantity, cost))
+        lots.add(self.cursor.lastrowid, quantity, cost)
+
+    def sell(self, portfolio_id, symbol, trade_id, date, price, quantity, currency):
+        # Match a sell against the open lots, store its realized P/L and return the average cost of what is left
+        method = self.method(portfolio_id)
+        lots = self.get(portfolio_id, symbol)
+        cost_basis, changes, remaining = lots.match(quantity, method)
+
+        self.cursor.executemany("DELETE FROM lots WHERE lot_id = ?", [(lot_id,) for lot_id, left in changes if left <= 0])
+        self.cursor.executemany("UPDATE lots SET quantity = ? WHERE lot_id = ?", [(left, lot_id) for lot_id, left in changes if left > 0])
+        if remaining is not None:
+            # Average cost keeps a single lot at the unchanged average
+            average_cost = cost_basis / quantity if quantity else 0.0
+            lot_id = None
+            if remaining > 1e-12:
+                self.cursor.execute("INSERT INTO lots (portfolio_id, symbol, trade_id, date, quantity, cost) VALUES (?, ?, ?, ?, ?, ?)",
+                                    (portfolio_id, symbol, trade_id, date, remaining, average_cost))
+                lot_id = self.cursor.lastrowid
+            lots.reset(lot_id, remaining, average_cost)
+
+        proceeds = price * quantity
+        self.cursor.execute("INSERT OR REPLACE INTO realized_pl (trade_id, portfolio_id, date, symbol, currency, quantity, proceeds, cost_basis, pl) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (trade_id, portfolio_id, date, symbol, currency, quantity, proceeds, cost_basis, proceeds - cost_basis))
+        return lots.average_cost()
+
+    def rebuild(self, portfolio_id, method):
+        # Replay the whole trade history of a portfolio into lots and realized P/L
+        with self.user.transaction():
+            self.delete(portfolio_id)
+            self.cursor.execute("INSERT INTO lot_methods (portfolio_id, method) VALUES (?, ?)", (portfolio_id, method))
+            self.cursor.execute("SELECT trade_id, date, action, symbol, currency, cost, quantity FROM trades "
+                                "WHERE portfolio_id = ? ORDER BY date, trade_id", (portfolio_id,))
+            for trade_id, date, action, symbol, currency, cost, quantity in self.cursor.fetchall():
+                if action == "buy":
+                    self.buy(portfolio_id, symbol, trade_id, date, cost, quantity)
+                elif action == "sell":
+                    self.sell(portfolio_id, symbol, trade_id, date, cost, min(quantity, self.get(portfolio_id, symbol).total_quantity()), currency)
+
+    def delete(self, portfolio_id):
+        for key in [key for key in self.open_lots if key[0] == portfolio_id]:
+            del self.open_lots[key]
+        self.cursor.execute("DELETE FROM lots WHERE portfolio_id = ?", (portfolio_id,))
+        self.cursor.execute("DELETE FROM realized_pl WHERE portfolio_id = ?", (portfolio_id,))
+        self.cursor.execute("DELETE FROM lot_methods WHERE portfolio_id = ?", (portfolio_id,))
+
+    def average_cost(self, portfolio_id, symbol):
+        return self.get(portfolio_id, symbol).average_cost()
+
+    def holding_cost(self, portfolio_id, symbol, quantity, cost):
+        # Average cost of the open lots for a holding, the stored cost when the lots do not cover its quantity
+        lots = self.get(portfolio_id, symbol)
+        if lots.total_quantity() < quantity - 1e-9:
+            return cost
+        return round(lots.average_cost(), 2)
+
+    def realized(self, portfolio_id, start, end):
+        # Realized P/L per currency between two dates
+        self.method(portfolio_id)
+        self.cursor.execute("SELECT currency, sum(pl) FROM realized_pl WHERE portfolio_id = ? AND date BETWEEN ? AND ? "
+                            "GROUP BY currency", (portfolio_id, start, end))
+        return {currency: round(pl, 2) for currency, pl in self.cursor.fetchall()}
+
+    def tax_report(self, portfolio_id, year):
+        # Quantity, proceeds, cost basis and realized P/L of every symbol sold in a year
+        self.method(portfolio_id)
+        self.cursor.execute("SELECT symbol, currency, sum(quantity), sum(proceeds), sum(cost_basis), sum(pl) FROM realized_pl "
+                            "WHERE portfolio_id = ? AND date BETWEEN ? AND ? GROUP BY symbol, currency ORDER BY symbol",
+                            (portfolio_id, f"{year}-01-01", f"{year}-12-31"))
+        return [{"symbol": symbol, "currency": currency, "quantity": quantity, "proceeds": round(proceeds, 2),
+                 "cost_basis": round(cost_basis, 2), "pl": round(pl, 2)}
+                for symbol, currency, quantity, proceeds, cost_basis, pl in self.cursor.fetchall()]
@@ -1,11 +1,30 @@
-from _datetime import datetime, timedelta
-import yfinance as yf
+from _datetime import datetime
+from bisect import bisect_right
+import csv
+from PriceProvider import YFinanceProvider
+from QuoteCache import QuoteCache
+from Instruments import Instruments
+from PriceHistory import PriceHistory
+from Snapshots import Snapshots
+from Lots import Lots
+from FX import FX
+from Instrumentation import instrumentation, timed, TracedCursor
 
 class Portfolio:
+    provider = YFinanceProvider()  # Price source shared by all portfolios, can be swapped with use_provider
+    cache = QuoteCache()  # Quotes and stock infos shared by get_price, get_prices and get_stock_info
+    async_engine = None  # AsyncPriceEngine used by portfolio_infos_async, built from the provider on first use
+
     def __init__(self, user):
         self.user = user
         self.conn = user.conn
         self.cursor = user.cursor
+        self.instruments = Instruments(user, Portfolio.get_stock_info)  # Locally stored name, exchange and currency per symbol
+        self.history = PriceHistory(user, Portfolio.get_history)  # Locally stored daily bars for dated lookups
+        self.fx = FX(self.history, Portfolio.get_rates)  # Exchange rates between the holding and reporting currencies
+        self.lots = Lots(user)  # Open lots and realized profit/loss of every sell
+        self.snapshots = Snapshots(user, self.history, self.lots, self.fx)  # Materialized daily portfolio values
+        self.listeners = []  # Callables (p_name, symbol) notified after a holding changed, e.g. LivePortfolio.on_trade
 
     @staticmethod
     def get_extension(stock_market):
@@ -22,29 +41,114 @@ class Portfolio:
         return extension
 
     @staticmethod
+    def use_provider(provider):
+        # Replace the price source, e.g. with a LocalPriceProvider for offline use
+        Portfolio.provider = provider
+        Portfolio.async_engine = None
+
+    @staticmethod
+    def use_async_engine(engine):
+        # Replace the async price engine, e.g. to set a concurrency cap and rate limit or use an async source
+        Portfolio.async_engine = engine
+
+    @staticmethod
+    def get_async_engine():
+        if Portfolio.async_engine is None:
+            from AsyncPriceEngine import AsyncPriceEngine, ThreadedPriceProvider  # asyncio is only loaded by the async reports
+            Portfolio.async_engine = AsyncPriceEngine(ThreadedPriceProvider(Portfolio.provider), Portfolio.get_extension,
+                                                      cache=Portfolio.cache)
+        return Portfolio.async_engine
+
+    @staticmethod
+    def use_cache(cache):
+        # Replace the quote cache, e.g. with QuoteCache(ttl=300, db_path="quotes.db") to keep quotes across sessions
+        Portfolio.cache = cache
+
+    @staticmethod
+    @timed("price.get_price")
     def get_price(symbol, stockmarket, date=None):
         # Get the appropriate market extension
         extension = Portfolio.get_extension(stockmarket)
         yfinance_extension = f"{symbol}{extension}"
 
-        # If no date is given, fetch the latest market price
-        if not date:
-            stock = yf.Ticker(yfinance_extension)
-            stock_info = stock.info
-            last_price = stock_info['regularMarketPrice']
-            return round(last_price, 2)
+        cached = Portfolio.cache.get(("price", symbol, stockmarket, date))
+        if cached is not None:
+            return cached
+
+        # Latest market price, or the last close on the given date
+        last_price = round(Portfolio.provider.get_price(yfinance_extension, date), 2)
+        Portfolio.cache.set(("price", symbol, stockmarket, date), last_price)
+        return last_price
 
-        # If a specific date is provided, fetch historical data
-        date_obj = datetime.strptime(date, "%Y-%m-%d")
-        date_obj = date_obj + timedelta(days=1)
-        past = date_obj - timedelta(days=15)
-        end_date = date_obj.strftime("%Y-%m-%d")
+    @staticmethod
+    @timed("price.get_prices")
+    def get_prices(pairs, date=None):
+        # Fetch the prices of many (symbol, market) pairs in one batch request
+        results = {}
+        yf_symbols = {}
+        with Portfolio.cache.batch(): # Quotes of this batch are not evicted by the rest of it
+            for symbol, market in dict.fromkeys(pairs):
+                cached = Portfolio.cache.get(("price", symbol, market, date))
+                if cached is not None:
+                    results[(symbol, market)] = cached
+                else:
+                    yf_symbols[(symbol, market)] = f"{symbol}{Portfolio.get_extension(market)}"
+
+            # Only the pairs missing from the cache go to the price source
+            if yf_symbols:
+                prices = Portfolio.provider.get_prices(list(yf_symbols.values()), date)
+
+                missing = [pair for pair in yf_symbols if yf_symbols[pair] not in prices]
+                if missing:
+                    raise KeyError(f"Price not found for: {', '.join(symbol for symbol, market in missing)}")
+
+                for (symbol, market), yf_symbol in yf_symbols.items():
+                    results[(symbol, market)] = round(prices[yf_symbol], 2)
+                    Portfolio.cache.set(("price", symbol, market, date), results[(symbol, market)])
+
+        return results
+
+    @staticmethod
+    @timed("price.get_rates")
+    def get_rates(currencies):
+        # Latest units per USD of many currencies in one batch. Unlike quotes, rates are not rounded to 2 decimals.
+        rates = {}
+        yf_symbols = {}
+        for currency in dict.fromkeys(currencies):
+            cached = Portfolio.cache.get(("fx", currency, None))
+            if cached is not None:
+                rates[currency] = cached
+            else:
+                yf_symbols[currency] = f"{currency}{Portfolio.get_extension("Foreign Currency")}"
 
-        df = yf.Ticker(yfinance_extension).history(start=past.strftime("%Y-%m-%d"), end=end_date) # Fetch historical data for the given date range
-        return round(df["Close"].iloc[-1], 2)
+        if yf_symbols:
+            prices = Portfolio.provider.get_prices(list(yf_symbols.values()))
+            for currency, yf_symbol in yf_symbols.items():
+                if yf_symbol not in prices:
+                    continue  # Left out, FX does not convert a currency without a rate
+                rates[currency] = float(prices[yf_symbol])
+                Portfolio.cache.set(("fx", currency, None), rates[currency])
+        return rates
 
     @staticmethod
-    def get_stock_info(symbol, stockmarket):
+    @timed("price.get_history")
+    def get_history(pairs, start, end):
+        # Download daily bars of many (symbol, market) pairs in one request, returns {(symbol, market): bars}
+        yf_symbols = {pair: f"{pair[0]}{Portfolio.get_extension(pair[1])}" for pair in dict.fromkeys(pairs)}
+        history = Portfolio.provider.get_history(list(yf_symbols.values()), start, end)
+        return {pair: history.get(yf_symbol, []) for pair, yf_symbol in yf_symbols.items()}
+
+    def price_on(self, symbol, stockmarket, date):
+        # Last close on or before the given date, served from the local price history
+        return self.history.close_on(symbol, stockmarket, date)
+
+    @staticmethod
+    @timed("price.get_stock_info")
+    def get_stock_info(symbol, stockmarket, use_cache=True):
+        cached = Portfolio.cache.get(("info", symbol, stockmarket)) if use_cache else None
+        if cached is not None:
+            return cached
+
         # Get the market extension for the given stock market
         extension = Portfolio.get_extension(stockmarket)
         yfinance_symbol = f"{symbol}{extension}"
@@ -68,208 +172,332 @@ class Portfolio:
             "CCY": "Foreign Currency"
         }
 
-        # Get stock info from Yahoo Finance
-        stock = yf.Ticker(yfinance_symbol)
-        stock_info = stock.info
+        # Get stock info from the price source
+        stock_info = Portfolio.provider.get_info(yfinance_symbol)
 
         # Extract company details from stock info
         company_name = stock_info.get('longName', stock_info.get('shortName', 'Name not available'))
         exchange = exchange_mapping.get(stock_info.get('exchange', 'Unknown'), "Unknown Exchange")
         currency = stock_info.get("currency", "Unknown")
 
-        infos = {"company_name": company_name, "exchange": exchange, "currency": currency} # Return the stock information in a dictionary
+        infos = {"company_name": company_name, "exchange": exchange, "currency": currency, "yf_symbol": yfinance_symbol} # Return the stock information in a dictionary
+        Portfolio.cache.set(("info", symbol, stockmarket), infos)
         return infos
 
-    def portfolio_infos(self, p_name):
-        self.cursor.execute(f"SELECT * FROM {p_name}") # Retrieve the portfolio information from the database
-        rows = self.cursor.fetchall()
-
-        tryusd_exchange = Portfolio.get_price("TRY", "Foreign Currency") # Get the current TRY to USD exchange rate
-        portfolio_value = 0
-        total_profit = 0
-        all_infos = {
-            "general": {
-                "portfolio_value": portfolio_value,
-                "total_profit": total_profit,
-                "profit_percentage": 0.0,
-            },
-            # Initialize portfolio structure for different markets
-            "America": {"total": 0, "profit": 0, "exchange": "$", "portfolio_percentage": 0 ,"stocks":[]},
-            "BIST": {"total": 0, "profit": 0, "exchange": "₺", "portfolio_percentage": 0 ,"stocks":[]},
-            "Crypto Market": {"total": 0, "profit": 0, "exchange": "$", "portfolio_percentage": 0 ,"stocks":[]},
-            "Commodity": {"total": 0, "profit": 0, "exchange": "$", "portfolio_percentage": 0 ,"stocks":[]}
-        }
-
-        # Process each stock in the portfolio
-        if rows:
-            for row in rows:
-                symbol = row[0]
-                cost = row[2]
-                quantity = row[3]
-                exchange = row [4]
-                market = row[5]
-
-                last_p = Portfolio.get_price(symbol, market) # Get the latest price of the stock
-
-                p_l = (last_p - cost) * quantity # Calculate profit/loss and total value
-                p_l = round(p_l, 2)
-
-                total = quantity * last_p
-                total = round(total, 2)
-
-                percentage = ((last_p - cost) / cost) * 100 # Calculate profit percentage
-                percentage = round(percentage, 2)
-
-                if exchange == "USD": # Adjust values for USD exchange rate if necessary
-                    all_infos["general"]["total_profit"] += p_l * tryusd_exchange
-                    all_infos["general"]["portfolio_value"] += total * tryusd_exchange
-
-                else:
-                    all_infos["general"]["total_profit"] += p_l
-                    all_infos["general"]["portfolio_value"] += total
-
-                all_infos[market]["total"] += total # Update market-specific information
-                all_infos[market]["profit"] += p_l
-
-                # Store detailed stock info
-                infos = {
-                            "symbol": symbol,
-                            "cost": cost,
-                            "quantity": quantity,
-                            "last_p": last_p,
-                            "total": total,
-                            "p_l": p_l,
-                            "p_l_percentage": percentage}
-
-                all_infos[market]["stocks"].append(infos)
-
-        # Calculate profit percentage based on portfolio value
-        if all_infos["general"]["portfolio_value"] > 0:
-            profit_percentage = (all_infos["general"]["total_profit"]/all_infos["general"]["portfolio_value"]) * 100
-            all_infos["general"]["profit_percentage"]= round(profit_percentage, 2)
-
-        # Calculate market-specific and stock-specific portfolio percentages
-        for key, info in all_infos.items():
-            if key != "general":
-                market_total_in_try = info["total"] * tryusd_exchange if info["exchange"] == "$" else info["total"]
-
-                if all_infos["general"]["portfolio_value"] > 0:
-                    market_percentage = (market_total_in_try / all_infos["general"]["portfolio_value"]) * 100
-                    info["portfolio_percentage"] = round(market_percentage, 2)
-
-                for stock in info["stocks"]:
-                    if info["exchange"] == "$":
-                        stock_total = stock["total"] * tryusd_exchange
-                    else:
-                        stock_total = stock["total"]
-
-                    portfolio_percentage = (stock_total / all_infos["general"]["portfolio_value"]) * 100
-                    stock["portfolio_percentage"] = round(portfolio_percentage, 2)
-
-        return all_infos
+    @timed("report.portfolio_infos")
+    def portfolio_infos(self, p_name, currency="TRY"):
+        return self.valuation(p_name, currency).to_infos()
+
+    async def portfolio_infos_async(self, p_name, currency="TRY"):
+        # Same result as portfolio_infos, with the quotes and the base rates fetched concurrently by the async
+        # price engine, so no request blocks the event loop
+        import asyncio
+        rows = self.holdings(p_name)
+        currencies = [row[4] for row in rows] + ["USD"]
+        self.fx.add(currencies + [currency])
+        engine = Portfolio.get_async_engine()
+        prices, quotes = await asyncio.gather(engine.get_prices([(row[0], row[5]) for row in rows]), engine.get_rates(self.fx.quoted()))
+        rates = self.fx.rates_to(currency, currencies, quotes=quotes)
+        from Valuation import Valuation
+        return Valuation(rows, prices, rates=rates, currency=currency).to_infos()
+
+    def holdings(self, p_name):
+        # Retrieve the portfolio information from the database
+        self.cursor.execute("SELECT symbol, name, cost, quantity, exchange, market FROM holdings WHERE portfolio_id = ?",
+                            (self.portfolio_id(p_name),))
+        return self.cursor.fetchall()
+
+    def valuation(self, p_name, currency="TRY"):
+        from Valuation import Valuation  # NumPy is only loaded by the reports, not by trades and portfolio management
+        rows = self.holdings(p_name)
+
+        # Get every holding's latest price in one batch and one rate per holding currency into the reporting currency
+        prices = Portfolio.get_prices([(row[0], row[5]) for row in rows])
+        rates = self.fx.rates_to(currency, [row[4] for row in rows] + ["USD"])
+
+        return Valuation(rows, prices, rates=rates, currency=currency) # Totals, profits and weights computed over the whole table at once
+
+    def portfolio_id(self, p_name):
+        # Id of the portfolio in the portfolios table
+        portfolio_id = self.user.portfolio_id(p_name)
+        if portfolio_id is None:
+            raise ValueError(f"Portfolio not found: {p_name}")
+        return portfolio_id
 
     def trade_history(self, p_name, symbol, cost, quantity, action, stockmarket):
-        # Define the table name for trade history based on portfolio name
-        portfolio_trade_history_n = f"{p_name}_trade_history"
-
-        # Retrieve stock information like company name, currency, and exchange
-        infos = Portfolio.get_stock_info(symbol, stockmarket)
+        # Retrieve stock information like company name, currency, and exchange from the instrument table
+        infos = self.instruments.get(symbol, stockmarket)
         s_name = infos["company_name"]
         currency = infos["currency"]
         exchange = infos["exchange"]
 
         today = datetime.now().strftime("%Y-%m-%d") # Get the current date for trade record
 
-        # If trade history table exists, insert a new trade record
-        if portfolio_trade_history_n in self.user.tables():
-            self.cursor.execute(f"INSERT INTO {portfolio_trade_history_n} "
-                                f"(date, action, symbol, s_name, exchange, currency, cost, quantity) "
-                                f"VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                                (today, action, symbol, s_name, exchange, currency, cost, quantity))
-
-        else: # If the table does not exist, create it and then insert the trade record
-            self.cursor.execute(f"CREATE TABLE IF NOT EXISTS {portfolio_trade_history_n} ("
-                                f"date DATE," # Date of the trade
-                                f"action TEXT,"  # Action (buy/sell)
-                                f"symbol TEXT, "  # Stock symbol
-                                f"s_name TEXT, "  # Company name
-                                f"exchange TEXT,"  # Exchange (e.g., USD, TRY)
-                                f"currency TEXT,"  # Currency type (USD, EUR, etc.)
-                                f"cost REAL, "  # Cost per unit of the stock
-                                f"quantity REAL) "  # Quantity of stocks bought or sold
-                                )
-            # Insert the trade record into the newly created table
-            self.cursor.execute(f"INSERT INTO {portfolio_trade_history_n} (date, action, symbol, exchange, currency, s_name, cost, quantity) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                                (today, action, symbol, exchange, currency, s_name, cost, quantity))
+        # Insert a new trade record for the portfolio
+        portfolio_id = self.portfolio_id(p_name)
+        self.lots.method(portfolio_id) # Build the lots from the earlier trades before this one is added
+        self.cursor.execute("INSERT INTO trades "
+                            "(portfolio_id, date, action, symbol, s_name, exchange, currency, cost, quantity) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (portfolio_id, today, action, symbol, s_name, exchange, currency, cost, quantity))
+        trade_id = self.cursor.lastrowid
+
+        # Open a lot for a buy, match a sell against the open lots and store its realized profit/loss
+        if action == "buy":
+            self.lots.buy(portfolio_id, symbol, trade_id, today, cost, quantity)
+        else:
+            self.lots.sell(portfolio_id, symbol, trade_id, today, cost, quantity, currency)
+        self.snapshots.mark_dirty(portfolio_id, today) # Daily values from today onward have to be recomputed
+        return trade_id
 
-    def buy_stock(self, p_name, symbol, cost, quantity, stockmarket):
-        # Retrieve existing stock information from the portfolio
-        self.cursor.execute(f"SELECT symbol, cost, quantity FROM {p_name} WHERE symbol = ?", (symbol,))
-        existing_stock = self.cursor.fetchone()
+    def refresh_instruments(self, symbol=None, stockmarket=None):
+        # Download the company name, exchange and currency again for one symbol or for every known symbol
+        self.instruments.refresh(symbol, stockmarket)
 
-        # Get stock information like company name and currency
-        stock_infos = Portfolio.get_stock_info(symbol, stockmarket)
+    def buy_stock(self, p_name, symbol, cost, quantity, stockmarket):
+        # Get stock information like company name and currency from the instrument table
+        stock_infos = self.instruments.get(symbol, stockmarket)
         s_name = stock_infos["company_name"]
         currency = stock_infos["currency"]
 
-        if existing_stock:
-            # If the stock already exists in the portfolio, update its quantity and cost
-            old_symbol, old_cost, old_quantity = existing_stock
+        portfolio_id = self.portfolio_id(p_name)
 
-            # Calculate new quantity and average cost
-            new_quantity = old_quantity + quantity
-            new_cost = (old_cost * old_quantity + cost * quantity) / new_quantity
-            new_cost = round(new_cost, 2)
+        with self.user.transaction(): # The holding update and its history row are committed together
+            # Retrieve existing stock information from the portfolio
+            self.cursor.execute("SELECT symbol, cost, quantity FROM holdings WHERE portfolio_id = ? AND symbol = ?",
+                                (portfolio_id, symbol))
+            existing_stock = self.cursor.fetchone()
 
-            # Update the stock entry in the portfolio
-            self.cursor.execute(f"UPDATE {p_name} SET cost = ?, quantity = ? WHERE symbol = ?",
-                                (new_cost, new_quantity, symbol))
-            print(f"{symbol} updated: New Cost = {new_cost}, New Quantity = {new_quantity}")
+            if existing_stock:
+                # If the stock already exists in the portfolio, update its quantity and cost
+                old_symbol, old_cost, old_quantity = existing_stock
 
-        else:
-            # If the stock does not exist, add it to the portfolio
-            self.cursor.execute(f"INSERT INTO {p_name} VALUES (?, ?, ?, ?, ?, ?)", (symbol, s_name, cost, quantity, currency, stockmarket))
-            print(f"{symbol} added to portfolio.")
+                # Calculate new quantity and average cost
+                new_quantity = old_quantity + quantity
+                new_cost = (old_cost * old_quantity + cost * quantity) / new_quantity
+                new_cost = round(new_cost, 2)
 
-        self.trade_history(p_name, symbol, cost, quantity, "buy", stockmarket) # Record the transaction in the trade history
+                # Update the stock entry in the portfolio
+                self.cursor.execute("UPDATE holdings SET cost = ?, quantity = ? WHERE portfolio_id = ? AND symbol = ?",
+                                    (new_cost, new_quantity, portfolio_id, symbol))
+                print(f"{symbol} updated: New Cost = {new_cost}, New Quantity = {new_quantity}")
+
+            else:
+                # If the stock does not exist, add it to the portfolio
+                self.cursor.execute("INSERT INTO holdings (portfolio_id, symbol, name, cost, quantity, exchange, market) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?)", (portfolio_id, symbol, s_name, cost, quantity, currency, stockmarket))
+                print(f"{symbol} added to portfolio.")
+
+            self.trade_history(p_name, symbol, cost, quantity, "buy", stockmarket) # Record the transaction in the trade history
+        self.notify(p_name, symbol)
 
     def sell_stock(self, p_name, symbol, cost, quantity, stockmarket):
-        self.cursor.execute(f"SELECT symbol, cost, quantity FROM {p_name} WHERE symbol = ?", (symbol,)) # Retrieve existing stock information from the portfolio
-        existing_stock = self.cursor.fetchone()
+        portfolio_id = self.portfolio_id(p_name)
 
-        if existing_stock:
-            # If the stock exists, update the quantity and cost based on the sale
-            old_symbol, old_cost, old_quantity = existing_stock
-            new_quantity = old_quantity - quantity
+        # An instrument missing from the table (e.g. after a migration) is downloaded before the write lock is taken
+        self.cursor.execute("SELECT 1 FROM holdings WHERE portfolio_id = ? AND symbol = ?", (portfolio_id, symbol))
+        if self.cursor.fetchone():
+            self.instruments.get(symbol, stockmarket)
 
-            if new_quantity > 0:
-                # Calculate new average cost after selling some stocks
-                new_cost = (old_cost * old_quantity - cost * quantity) / new_quantity
-                new_cost = round(new_cost, 2)
+        with self.user.transaction(): # The holding update and its history row are committed together
+            self.cursor.execute("SELECT symbol, cost, quantity FROM holdings WHERE portfolio_id = ? AND symbol = ?",
+                                (portfolio_id, symbol)) # Retrieve existing stock information from the portfolio
+            existing_stock = self.cursor.fetchone()
 
-                # Update the portfolio with the new values
-                self.cursor.execute(f"UPDATE {p_name} SET cost = ?, quantity = ? WHERE symbol = ?",
-                                    (new_cost, new_quantity, symbol))
+            if existing_stock:
+                # If the stock exists, update the quantity and cost based on the sale
+                old_symbol, old_cost, old_quantity = existing_stock
+                new_quantity = old_quantity - quantity
 
-                print(f"{symbol} updated: New Cost = {new_cost}, New Quantity = {new_quantity}")
-                self.trade_history(p_name, symbol, cost, quantity, "sell", stockmarket) # Record the sell transaction in the trade history
+                if new_quantity > 0:
+                    self.trade_history(p_name, symbol, cost, quantity, "sell", stockmarket) # Record the sell transaction in the trade history
 
-            elif new_quantity == 0:
-                # If the stock quantity becomes zero, delete it from the portfolio
-                self.cursor.execute(f"DELETE FROM {p_name} WHERE symbol = ?", (symbol,))
-                print(f"{symbol} stock has been removed from the table because you have no more lots left.")
-                self.trade_history(p_name, symbol, cost, quantity, "sell", stockmarket) # Record the sell transaction in the trade history
+                    # The remaining lots keep their own cost, so the new cost is their average
+                    new_cost = self.lots.holding_cost(portfolio_id, symbol, new_quantity, old_cost)
 
-            # If the quantity to sell is more than what the user holds, show an error
-            else:
-                print(f"You don't have that many lots. Your lot count at {symbol} is: {old_quantity}")
-        else:
-            print("You have entered an incorrect or non-existent stock symbol") # If the stock doesn't exist, show an error
+                    # Update the portfolio with the new values
+                    self.cursor.execute("UPDATE holdings SET cost = ?, quantity = ? WHERE portfolio_id = ? AND symbol = ?",
+                                        (new_cost, new_quantity, portfolio_id, symbol))
+
+                    print(f"{symbol} updated: New Cost = {new_cost}, New Quantity = {new_quantity}")
 
+                elif new_quantity == 0:
+                    # If the stock quantity becomes zero, delete it from the portfolio
+                    self.cursor.execute("DELETE FROM holdings WHERE portfolio_id = ? AND symbol = ?", (portfolio_id, symbol))
+                    print(f"{symbol} stock has been removed from the table because you have no more lots left.")
+                    self.trade_history(p_name, symbol, cost, quantity, "sell", stockmarket) # Record the sell transaction in the trade history
 
-    def portfolio_status(self, p_name):
+                # If the quantity to sell is more than what the user holds, show an error
+                else:
+                    print(f"You don't have that many lots. Your lot count at {symbol} is: {old_quantity}")
+            else:
+                print("You have entered an incorrect or non-existent stock symbol") # If the stock doesn't exist, show an error
+        self.notify(p_name, symbol)
+
+    def notify(self, p_name, symbol):
+        for listener in self.listeners:
+            listener(p_name, symbol)
+
+    def import_trades(self, p_name, trades, progress_every=1000):
+        # Import many trades at once, e.g. a broker history. trades is a CSV file path (with a
+        # date,action,symbol,cost,quantity,market header) or any iterable of such dicts or tuples.
+        # Invalid rows are skipped and reported, the valid ones are written in a single transaction.
+        if isinstance(trades, str):
+            with open(trades, newline="", encoding="utf-8") as file:
+                return self.import_trades(p_name, csv.DictReader(file), progress_every)
+
+        # Current holdings, updated in memory while the trades are replayed
+        portfolio_id = self.portfolio_id(p_name)
+        self.cursor.execute("SELECT symbol, name, cost, quantity, exchange, market FROM holdings WHERE portfolio_id = ?",
+                            (portfolio_id,))
+        holdings = {row[0]: list(row) for row in self.cursor.fetchall()}
+        # Recorded trades per symbol as (dates, running net quantity), a sell can only use the quantity held on its own date
+        recorded = {}
+        self.cursor.execute("SELECT symbol, date, sum(CASE WHEN action = 'buy' THEN quantity ELSE -quantity END) FROM trades "
+                            "WHERE portfolio_id = ? GROUP BY symbol, date ORDER BY symbol, date", (portfolio_id,))
+        for symbol, date, change in self.cursor.fetchall():
+            dates, running = recorded.setdefault(symbol, ([], []))
+            dates.append(date)
+            running.append((running[-1] if running else 0) + change)
+        touched = set()
+        infos = {}  # Instrument information looked up once per symbol
+        history_rows = []
+        rejected = []
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        # Parse and validate every row first, dates are stored as YYYY-MM-DD so they sort and compare as text
+        rows = []
+        for line, trade in enumerate(trades, start=1):
+            if not isinstance(trade, dict):
+                trade = dict(zip(("date", "action", "symbol", "cost", "quantity", "market"), trade))
+
+            try:
+                date = datetime.strptime(trade.get("date") or today, "%Y-%m-%d").strftime("%Y-%m-%d")
+                action = trade["action"].strip().lower()
+                symbol = trade["symbol"].strip().upper()
+                stockmarket = trade["market"].strip()
+                cost = float(trade["cost"])
+                quantity = float(trade["quantity"])
+            except (KeyError, TypeError, ValueError, AttributeError) as error:
+                rejected.append((line, trade, f"Invalid row: {error}"))
+                continue
+
+            if action not in ("buy", "sell") or cost <= 0 or quantity <= 0:
+                rejected.append((line, trade, "Action must be buy or sell with a positive cost and quantity"))
+                continue
+            if date > today:
+                rejected.append((line, trade, f"Trade date {date} is in the future"))
+                continue
+            rows.append((date, line, trade, action, symbol, stockmarket, cost, quantity))
+
+        # Replay in date order (file order within a day), the same order the lots are matched in
+        rows.sort(key=lambda row: row[:2])
+        for count, (date, line, trade, action, symbol, stockmarket, cost, quantity) in enumerate(rows, start=1):
+            holding = holdings.get(symbol)
+            if action == "sell":
+                # Recorded trades after the sell date are not held yet on that date
+                dates, running = recorded.get(symbol, ([], []))
+                before = bisect_right(dates, date)
+                later = (running[-1] if running else 0) - (running[before - 1] if before else 0)
+                held = holding[3] - later if holding else 0
+                if held < quantity:
+                    rejected.append((line, trade, f"Oversell: {held} lots of {symbol} held on {date}"))
+                    continue
+
+            if (symbol, stockmarket) not in infos:
+                try:
+                    infos[(symbol, stockmarket)] = self.instruments.get(symbol, stockmarket)
+                except Exception as error:
+                    rejected.append((line, trade, f"Instrument information not found: {error}"))
+                    continue
+            stock_infos = infos[(symbol, stockmarket)]
+
+            # Same cost and quantity rules as buy_stock and sell_stock
+            if action == "buy" and holding:
+                new_quantity = holding[3] + quantity
+                holding[2] = round((holding[2] * holding[3] + cost * quantity) / new_quantity, 2)
+                holding[3] = new_quantity
+            elif action == "buy":
+                holdings[symbol] = [symbol, stock_infos["company_name"], cost, quantity, stock_infos["currency"], stockmarket]
+            else:
+                new_quantity = holding[3] - quantity
+                if new_quantity > 0:
+                    holding[3] = new_quantity # The cost is taken from the remaining lots below
+                else:
+                    del holdings[symbol]
+            touched.add(symbol)
+
+            history_rows.append((portfolio_id, date, action, symbol, stock_infos["company_name"], stock_infos["exchange"],
+                                 stock_infos["currency"], cost, quantity))
+            if progress_every and count % progress_every == 0:
+                print(f"{count} rows processed, {len(history_rows)} accepted, {len(rejected)} rejected")
+
+        # Write the history, the lots and the recomputed holdings of every touched symbol in one transaction
+        method = self.lots.method(portfolio_id)
+        with self.user.transaction():
+            self.cursor.executemany("INSERT INTO trades "
+                                    "(portfolio_id, date, action, symbol, s_name, exchange, currency, cost, quantity) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", history_rows)
+            if history_rows:
+                self.lots.rebuild(portfolio_id, method) # Imported trades may be older than the open lots
+                for symbol in touched:
+                    if symbol in holdings:
+                        holdings[symbol][2] = self.lots.holding_cost(portfolio_id, symbol, holdings[symbol][3], holdings[symbol][2])
+            self.cursor.executemany("DELETE FROM holdings WHERE portfolio_id = ? AND symbol = ?",
+                                    [(portfolio_id, symbol) for symbol in touched])
+            self.cursor.executemany("INSERT INTO holdings (portfolio_id, symbol, name, cost, quantity, exchange, market) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    [[portfolio_id] + holdings[symbol] for symbol in touched if symbol in holdings])
+            if history_rows:
+                self.snapshots.mark_dirty(portfolio_id, min(row[1] for row in history_rows))
+
+        for symbol in touched:
+            self.notify(p_name, symbol)
+
+        print(f"{len(history_rows)} trades imported into {p_name}, {len(rejected)} rejected.")
+        rejected.sort(key=lambda row: row[0])
+        for line, trade, reason in rejected:
+            print(f"Row {line} rejected: {reason}")
+        return {"imported": len(history_rows), "rejected": rejected}
+
+    def set_cost_method(self, p_name, method):
+        # Match sells against the lots first in first out ("fifo"), last in first out ("lifo") or at the average cost ("average").
+        # The whole history is matched again, so the holding costs, realized profits and daily snapshots change with it.
+        portfolio_id = self.portfolio_id(p_name)
+        with self.user.transaction():
+            self.lots.set_method(portfolio_id, method)
+            self.cursor.execute("SELECT symbol, quantity, cost FROM holdings WHERE portfolio_id = ?", (portfolio_id,))
+            rows = self.cursor.fetchall()
+            symbols = [row[0] for row in rows]
+            self.cursor.executemany("UPDATE holdings SET cost = ? WHERE portfolio_id = ? AND symbol = ?",
+                                    [(self.lots.holding_cost(portfolio_id, symbol, quantity, cost), portfolio_id, symbol)
+                                     for symbol, quantity, cost in rows])
+            self.cursor.execute("SELECT min(date) FROM trades WHERE portfolio_id = ?", (portfolio_id,))
+            first_date = self.cursor.fetchone()[0]
+            if first_date:
+                self.snapshots.mark_dirty(portfolio_id, first_date)
+
+        for symbol in symbols:
+            self.notify(p_name, symbol)
+        print(f"{p_name} now uses the {method} cost method.")
+
+    def realized_pl(self, p_name, start, end):
+        # Profit/loss realized by the sells between two dates, per trade currency
+        return self.lots.realized(self.portfolio_id(p_name), start, end)
+
+    def tax_report(self, p_name, year):
+        # Realized profit/loss of every symbol sold in a year, with its proceeds and cost basis
+        report = self.lots.tax_report(self.portfolio_id(p_name), year)
+        for row in report:
+            print(f"{row["symbol"]} ({row["currency"]}): quantity {row["quantity"]}, proceeds {row["proceeds"]}, "
+                  f"cost basis {row["cost_basis"]}, P/L {row["pl"]}")
+        return report
+
+
+    @timed("report.portfolio_status")
+    def portfolio_status(self, p_name, currency="TRY"):
         # Retrieve the portfolio information using the portfolio_infos method
-        portfolio_infos = self.portfolio_infos(p_name)
+        portfolio_infos = self.portfolio_infos(p_name, currency)
         general_info = portfolio_infos["general"]
 
         # Iterate through each market (except the 'general' market). Because it is a dictionary containing general information
@@ -299,102 +527,118 @@ class Portfolio:
                         f"Profit: {portfolio_infos[market]["profit"]} "
                         f"Market Percentage: %{portfolio_infos[market]["portfolio_percentage"]} ***\n")
         # Print the overall portfolio value, total profit, and profit percentage
-        print(f"Portfolio value: {round(general_info["portfolio_value"],2)} "
-              f"Total Profit: {round(general_info["total_profit"], 2)} (%{general_info["profit_percentage"]})")
-
-    def portfolio_status_date(self, p_name, date=datetime.now().strftime("%Y-%m-%d")):
-        # Retrieve all trade history records after the specified date
-        self.cursor.execute(f"SELECT * FROM {p_name}_trade_history WHERE date >= ?", (date,))
-        history = self.cursor.fetchall()
-        trades = []
+        sign = FX.signs.get(currency, f" {currency}")
+        print(f"Portfolio value: {round(general_info["portfolio_value"],2)}{sign} "
+              f"Total Profit: {round(general_info["total_profit"], 2)}{sign} (%{general_info["profit_percentage"]})")
+
+    @timed("report.portfolio_status_date")
+    def portfolio_status_date(self, p_name, date=datetime.now().strftime("%Y-%m-%d"), currency="TRY"):
+        portfolio_id = self.portfolio_id(p_name)
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        # Daily exchange rates of every trade currency since the date, read from the local history in one pass
+        self.cursor.execute("SELECT DISTINCT currency FROM trades WHERE portfolio_id = ? AND date >= ?", (portfolio_id, date))
+        trade_currencies = [row[0] for row in self.cursor.fetchall()]
+        if trade_currencies:
+            self.fx.preload(date, today, trade_currencies + [currency])
+        rates_date, rates = None, {}  # Rates into the reporting currency on the date of the previous trade
+
+        # Stream the trade history records after the specified date into one accumulator per symbol,
+        # with the prices converted at the exchange rate of the day of each trade. The stream has its own cursor,
+        # a rate lookup may download history through self.cursor while it is read.
+        trade_cursor = self.conn.cursor(TracedCursor)
+        trade_cursor.execute("SELECT date, action, symbol, exchange, currency, cost, quantity "
+                             "FROM trades WHERE portfolio_id = ? AND date >= ?",
+                             (portfolio_id, date))
+        trades = {}
 
         # Process each trade in the history
-        for history_ in history:
-            if history_[1] == "buy":
-                # Find if the trade already exists for the symbol in the 'trades' list
-                trade = next((trade for trade in trades if trade["symbol"] == history_[2]), None)
-                if trade:
-                    # Update existing buy trade by adding new quantity and adjusting cost
-                    buy_quantity = history_[7] + trade["buy_quantity"]
-                    trade["buy_cost"] = (trade["buy_cost"] * trade["buy_quantity"] + history_[6] * history_[7]) / buy_quantity
-                    trade["buy_quantity"] = buy_quantity
-
-                else:
-                    # Add new buy trade to the trades list
-                    trades.append({"symbol": history_[2],
-                                   "buy_cost": history_[6],
-                                   "sell_cost": 0,
-                                   "buy_quantity": history_[7],
-                                   "sell_quantity": 0,
-                                   "Market": history_[4],
-                                   "Exchange": history_[5]})
-
-            elif history_[1] == "sell":
-                # Find if the trade exists for the symbol in the 'trades' list
-                trade = next((trade for trade in trades if trade["symbol"] == history_[2]), None)
-                if trade:
-                    # Update existing sell trade by adding new quantity and adjusting cost
-                    sell_quantity = trade["sell_quantity"] + history_[7]
-                    trade["sell_cost"] = (trade["sell_cost"] * trade["sell_quantity"] + history_[6] * history_[7]) / sell_quantity
-                    trade["sell_quantity"] = sell_quantity
-
-                else:
-                    # Add new sell trade to the trades list
-                    trades.append({"symbol": history_[2],
-                                   "buy_cost": 0,
-                                   "sell_cost": history_[6],
-                                   "buy_quantity": 0,
-                                   "sell_quantity": history_[7],
-                                   "Market": history_[4],
-                                   "Exchange": history_[5]})
+        for trade_date, action, symbol, market, trade_currency, cost, quantity in trade_cursor:
+            if trade_date != rates_date:
+                rates_date, rates = trade_date, self.fx.rates_to(currency, trade_currencies, trade_date)
+            cost *= rates[trade_currency]
+
+            trade = trades.get(symbol)
+            if trade is None and action in ("buy", "sell"):
+                trade = trades[symbol] = {"symbol": symbol,
+                                          "buy_cost": 0,
+                                          "sell_cost": 0,
+                                          "buy_quantity": 0,
+                                          "sell_quantity": 0,
+                                          "Market": market,
+                                          "Exchange": trade_currency}
+
+            if action == "buy":
+                # Update the buy side by adding the new quantity and adjusting the average cost
+                buy_quantity = trade["buy_quantity"] + quantity
+                trade["buy_cost"] = (trade["buy_cost"] * trade["buy_quantity"] + cost * quantity) / buy_quantity
+                trade["buy_quantity"] = buy_quantity
+
+            elif action == "sell":
+                # Update the sell side by adding the new quantity and adjusting the average price
+                sell_quantity = trade["sell_quantity"] + quantity
+                trade["sell_cost"] = (trade["sell_cost"] * trade["sell_quantity"] + cost * quantity) / sell_quantity
+                trade["sell_quantity"] = sell_quantity
 
             else:
                 print("databasede bir sıkıntı var")
+        trades = list(trades.values())
+
         # Retrieve the current portfolio value
-        infos = self.portfolio_infos(p_name)
+        infos = self.portfolio_infos(p_name, currency)
         total_value = infos["general"]["portfolio_value"]
-        # Get the current exchange rate for TRY (Turkish Lira)
-        tryusd_exchange = Portfolio.get_price("TRY", "Foreign Currency")
+        # Batch the current prices and the past prices needed by the trades
+        current_pairs = [(trade["symbol"], trade["Market"]) for trade in trades if trade["buy_quantity"] >= trade["sell_quantity"]]
+        past_pairs = [(trade["symbol"], trade["Market"]) for trade in trades if trade["buy_quantity"] < trade["sell_quantity"]]
+        current_prices = Portfolio.get_prices(current_pairs)
+        past_prices = self.history.closes_on(past_pairs, date) if past_pairs else {}
+
+        # Current prices use today's exchange rates and past prices the rates of the date, one rate per currency
+        current_rates = self.fx.rates_to(currency, trade_currencies)
+        past_rates = self.fx.rates_to(currency, trade_currencies, date) if past_pairs else {}
         p_l = 0
         # Calculate the profit and loss for each trade
         for trade in trades:
             quantity = (trade["buy_quantity"] - trade["sell_quantity"])
             if quantity < 0:
                 # If there are more sell transactions than buy, calculate profit/loss for past prices
-                past_p = Portfolio.get_price(trade["symbol"], trade["Market"], date)
-
-                if trade["Exchange"] == "USD": # Adjust for USD exchange if needed
-                    past_p *= tryusd_exchange
-                    sell_cost = trade["sell_cost"] * tryusd_exchange
-
-                else:
-                    sell_cost = trade["sell_cost"]
-                p_l += (sell_cost - past_p) * abs(quantity)
+                past_p = past_prices[(trade["symbol"], trade["Market"])] * past_rates[trade["Exchange"]]
+                p_l += (trade["sell_cost"] - past_p) * abs(quantity)
 
             else:
                 # If there are more buy transactions than sell, calculate profit/loss for current prices
-                today_p = Portfolio.get_price(trade["symbol"], trade["Market"])
-                if trade["Exchange"] == "USD":
-                    today_p *= tryusd_exchange
-                    buy_cost = trade["buy_cost"] * tryusd_exchange
-
-                else:
-                    buy_cost = trade["buy_cost"]
-                p_l += (today_p - buy_cost) * quantity
+                today_p = current_prices[(trade["symbol"], trade["Market"])] * current_rates[trade["Exchange"]]
+                p_l += (today_p - trade["buy_cost"]) * quantity
             # Calculate the profit/loss for trades that have both buy and sell transactions
             trade_p_l = (trade["buy_cost"] - trade["sell_cost"]) * min(trade["buy_quantity"], trade["sell_quantity"])
             p_l += trade_p_l
 
         # Calculate the number of days between the provided date and today
-        today = datetime.now().date()
-        date = datetime.strptime(date, "%Y-%m-%d").date()
-        last_days = today - date
+        last_days = datetime.strptime(today, "%Y-%m-%d").date() - datetime.strptime(date, "%Y-%m-%d").date()
 
         # Calculate the profit/loss percentage based on the total portfolio value
         percentage = round(p_l/total_value *100, 2)
 
         # Print the profit/loss for the given period with percentage
+        sign = FX.signs.get(currency, f" {currency}")
         if p_l >= 0:
-            print(f"{round(p_l, 2)}₺ (+{percentage})% Last {last_days.days} days")
+            print(f"{round(p_l, 2)}{sign} (+{percentage})% Last {last_days.days} days")
+        else:
+            print(f"{round(p_l, 2)}{sign} ({percentage})% Last {last_days.days} days")
+
+    def portfolio_snapshots(self, p_name, start, end):
+        # Daily market value, cost basis and realized/unrealized P/L between two dates, read from the snapshot table
+        return self.snapshots.range(self.portfolio_id(p_name), start, end)
+
+    @timed("report.portfolio_status_period")
+    def portfolio_status_period(self, p_name, days):
+        # Profit/loss over the last days (e.g. 30, 90, 365) from the daily snapshots
+        result = self.snapshots.period_return(self.portfolio_id(p_name), days)
+        if result["p_l"] >= 0:
+            print(f"{result["p_l"]}₺ (+{result["percentage"]})% Last {days} days")
         else:
-            print(f"{round(p_l, 2)}₺ ({percentage})% Last {last_days.days} days")
\ No newline at end of file
+            print(f"{result["p_l"]}₺ ({result["percentage"]})% Last {days} days")
+        return result
+
+
+instrumentation.register("quote_cache", lambda: Portfolio.cache.stats()) # Cache hit rates in the instrumentation snapshot
\ No newline at end of file
@@ -0,0 +1,117 @@
+from _datetime import datetime, timedelta
+
+
+class PriceHistory:
+    # Local store of daily OHLC bars. Missing date ranges are downloaded in one request for all symbols,
+    # after that only new bars are appended and dated lookups are answered from the table.
+    def __init__(self, user, fetch_history):
+        self.user = user
+        self.conn = user.conn
+        self.cursor = user.cursor
+        self.fetch_history = fetch_history  # Callable (pairs, start, end) -> {(symbol, market): bars}
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS price_history ("
+                            "symbol TEXT, "  # Stock symbol
+                            "market TEXT, "  # Market name (e.g., BIST)
+                            "date TEXT, "  # Trading day (YYYY-MM-DD)
+                            "open REAL, "
+                            "high REAL, "
+                            "low REAL, "
+                            "close REAL, "
+                            "volume REAL, "
+                            "PRIMARY KEY (symbol, market, date)) WITHOUT ROWID")
+        # Date range already downloaded per symbol, so holidays without bars are not fetched again
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS price_history_coverage ("
+                            "symbol TEXT, "
+                            "market TEXT, "
+                            "first_date TEXT, "
+                            "last_date TEXT, "
+                            "PRIMARY KEY (symbol, market))")
+
+    def ensure(self, pairs, start, end):
+        # Make sure bars from start to end are stored for every (symbol, market) pair
+        today = datetime.now().strftime("%Y-%m-%d")
+        end = min(end, today)
+        missing_start, missing_end = None, None
+        missing_pairs = []
+
+        for symbol, market in dict.fromkeys(pairs):
+            self.cursor.execute("SELECT first_date, last_date FROM price_history_coverage WHERE symbol = ? AND market = ?",
+                                (symbol, market))
+            coverage = self.cursor.fetchone()
+
+            if not coverage:
+                ranges = [(start, end)]
+            else:
+                ranges = []
+                if start < coverage[0]:
+                    ranges.append((start, coverage[0]))
+                if end > coverage[1]:
+                    ranges.append((coverage[1], end))
+
+            # Every missing range is merged into a single request window
+            for range_start, range_end in ranges:
+                missing_start = min(missing_start or range_start, range_start)
+                missing_end = max(missing_end or range_end, range_end)
+            if ranges:
+                missing_pairs.append((symbol, market))
+
+        if not missing_pairs:
+            return
+
+        # Download first, the write lock is only held while the bars are stored. Inside a caller's
+        # transaction the bars become part of it (a savepoint) instead of committing its work early.
+        history = self.fetch_history(missing_pairs, missing_start, missing_end)
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        covered_end = min(missing_end, yesterday)
+        with self.user.transaction():
+            self.cursor.executemany("INSERT OR REPLACE INTO price_history (symbol, market, date, open, high, low, close, volume) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    [(symbol, market) + tuple(bar) for (symbol, market), bars in history.items() for bar in bars])
+
+            # Today's bar is still moving, so coverage stops at yesterday and today is fetched again next time.
+            # A pair without bars (failed or empty download) stays uncovered and is requested again.
+            for symbol, market in [pair for pair in missing_pairs if history.get(pair)]:
+                self.cursor.execute("INSERT INTO price_history_coverage (symbol, market, first_date, last_date) VALUES (?, ?, ?, ?) "
+                                    "ON CONFLICT (symbol, market) DO UPDATE SET "
+                                    "first_date = min(first_date, excluded.first_date), last_date = max(last_date, excluded.last_date)",
+                                    (symbol, market, missing_start, covered_end))
+
+    def update(self, pairs):
+        # Append the bars published since the last download
+        today = datetime.now().strftime("%Y-%m-%d")
+        self.ensure(pairs, today, today)
+
+    def closes_on(self, pairs, date, lookback=15):
+        # Last close on or before date for every pair, so weekends and holidays use the previous trading day
+        start = (datetime.strptime(date, "%Y-%m-%d") - timedelta(days=lookback)).strftime("%Y-%m-%d")
+        self.ensure(pairs, start, date)
+
+        closes = {}
+        for symbol, market in dict.fromkeys(pairs):
+            self.cursor.execute("SELECT close FROM price_history WHERE symbol = ? AND market = ? AND date <= ? "
+                                "ORDER BY date DESC LIMIT 1", (symbol, market, date))
+            row = self.cursor.fetchone()
+            if not row:
+                raise KeyError(f"No close found for {symbol} on or before {date}")
+            closes[(symbol, market)] = round(row[0], 2)
+        return closes
+
+    def close_on(self, symbol, stockmarket, date):
+        return self.closes_on([(symbol, stockmarket)], date)[(symbol, stockmarket)]
+
+    def stored_closes(self, pairs, start, end):
+        # Closes already in the table between two dates, {(symbol, market): [(date, close), ...]} oldest first
+        closes = {}
+        for symbol, market in dict.fromkeys(pairs):
+            self.cursor.execute("SELECT date, close FROM price_history WHERE symbol = ? AND market = ? AND date BETWEEN ? AND ? "
+                                "ORDER BY date", (symbol, market, start, end))
+            closes[(symbol, market)] = self.cursor.fetchall()
+        return closes
+
+    def bars(self, symbol, stockmarket, start, end):
+        # Stored bars between two dates, oldest first
+        self.ensure([(symbol, stockmarket)], start, end)
+        self.cursor.execute("SELECT date, open, high, low, close, volume FROM price_history "
+                            "WHERE symbol = ? AND market = ? AND date BETWEEN ? AND ? ORDER BY date",
+                            (symbol, stockmarket, start, end))
+        return self.cursor.fetchall()
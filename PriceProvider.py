@@ -0,0 +1,249 @@
+from concurrent.futures import ThreadPoolExecutor
+from _datetime import datetime, timedelta
+import math
+import zlib
+
+
+class PriceProvider:
+    # Base class for price sources. Subclasses only have to implement the single-symbol calls,
+    # the batch calls fall back to a bounded thread pool over them.
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+
+    def get_price(self, yf_symbol, date=None):
+        raise NotImplementedError
+
+    def get_info(self, yf_symbol):
+        raise NotImplementedError
+
+    def get_symbol_history(self, yf_symbol, start, end):
+        # Daily bars from start to end (inclusive) as a list of (date, open, high, low, close, volume)
+        raise NotImplementedError
+
+    def get_history(self, yf_symbols, start, end):
+        # Daily bars of many symbols at once, returns {yf_symbol: bars}
+        yf_symbols = list(dict.fromkeys(yf_symbols))
+        if not yf_symbols:
+            return {}
+
+        def fetch(yf_symbol):
+            try:
+                return yf_symbol, self.get_symbol_history(yf_symbol, start, end)
+            except Exception as error:
+                print(f"History could not be fetched for {yf_symbol}: {error}")
+                return yf_symbol, []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(yf_symbols))) as executor:
+            return dict(executor.map(fetch, yf_symbols))
+
+    def get_prices(self, yf_symbols, date=None):
+        # Resolve many symbols at once, returns {yf_symbol: price}. Symbols without a price are left out
+        yf_symbols = list(dict.fromkeys(yf_symbols))
+        if not yf_symbols:
+            return {}
+
+        def fetch(yf_symbol):
+            try:
+                return yf_symbol, self.get_price(yf_symbol, date)
+            except Exception as error:
+                print(f"Price could not be fetched for {yf_symbol}: {error}")
+                return yf_symbol, None
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(yf_symbols))) as executor:
+            results = executor.map(fetch, yf_symbols)
+
+        return {yf_symbol: price for yf_symbol, price in results if price is not None}
+
+
+class YFinanceProvider(PriceProvider):
+    # Yahoo Finance source. Batches go through a single yf.download request
+    @property
+    def yf(self):
+        # yfinance pulls in pandas and requests, so it is only imported when the first quote is requested
+        import yfinance
+        return yfinance
+
+    def get_price(self, yf_symbol, date=None):
+        # If no date is given, fetch the latest market price
+        if not date:
+            stock_info = self.yf.Ticker(yf_symbol).info
+            return stock_info['regularMarketPrice']
+
+        # If a specific date is provided, take the last close of a 15-day window ending on that date
+        start, end = YFinanceProvider.date_window(date)
+        df = self.yf.Ticker(yf_symbol).history(start=start, end=end)
+        return df["Close"].iloc[-1]
+
+    def get_info(self, yf_symbol):
+        return self.yf.Ticker(yf_symbol).info
+
+    def get_symbol_history(self, yf_symbol, start, end):
+        df = self.yf.Ticker(yf_symbol).history(start=start, end=YFinanceProvider.next_day(end), auto_adjust=False)
+        return YFinanceProvider.bars(df)
+
+    def get_history(self, yf_symbols, start, end):
+        # One yf.download request for every symbol and the whole date range
+        yf_symbols = list(dict.fromkeys(yf_symbols))
+        if not yf_symbols:
+            return {}
+
+        df = self.yf.download(yf_symbols, start=start, end=YFinanceProvider.next_day(end), progress=False,
+                         auto_adjust=False, group_by="ticker")
+        history = {}
+        for yf_symbol in yf_symbols:
+            if df is not None and yf_symbol in df.columns.get_level_values(0):
+                history[yf_symbol] = YFinanceProvider.bars(df[yf_symbol])
+            else:
+                history[yf_symbol] = []
+        return history
+
+    @staticmethod
+    def bars(df):
+        # Convert a yfinance OHLCV frame into (date, open, high, low, close, volume) rows
+        df = df.dropna(subset=["Close"])
+        return [(index.strftime("%Y-%m-%d"), float(row["Open"]), float(row["High"]), float(row["Low"]),
+                 float(row["Close"]), float(row["Volume"])) for index, row in df.iterrows()]
+
+    @staticmethod
+    def next_day(date):
+        # yfinance treats the end date as exclusive
+        return (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    def get_prices(self, yf_symbols, date=None):
+        yf_symbols = list(dict.fromkeys(yf_symbols))
+        if not yf_symbols:
+            return {}
+
+        if date:
+            start, end = YFinanceProvider.date_window(date)
+            df = self.yf.download(yf_symbols, start=start, end=end, progress=False, auto_adjust=False, group_by="column")
+        else:
+            df = self.yf.download(yf_symbols, period="5d", progress=False, auto_adjust=False, group_by="column")
+
+        prices = {}
+        if df is not None and not df.empty:
+            closes = df["Close"]
+            for yf_symbol in yf_symbols:
+                # A single ticker may come back as a Series instead of a one-column frame
+                column = closes[yf_symbol] if yf_symbol in getattr(closes, "columns", []) else None
+                if column is None and len(yf_symbols) == 1 and not hasattr(closes, "columns"):
+                    column = closes
+                if column is None:
+                    continue
+                column = column.dropna()
+                if not column.empty:
+                    prices[yf_symbol] = float(column.iloc[-1])
+
+        # Symbols the bulk request could not resolve are retried one by one
+        missing = [yf_symbol for yf_symbol in yf_symbols if yf_symbol not in prices]
+        if missing:
+            prices.update(super().get_prices(missing, date))
+        return prices
+
+    @staticmethod
+    def date_window(date):
+        # 15 days back from the given date so weekends and holidays still have a close, end is exclusive
+        date_obj = datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)
+        past = date_obj - timedelta(days=15)
+        return past.strftime("%Y-%m-%d"), date_obj.strftime("%Y-%m-%d")
+
+
+class LocalPriceProvider(PriceProvider):
+    # Offline source backed by plain dictionaries, for tests and demos without network
+    # prices: {yf_symbol: price}, infos: {yf_symbol: info dict}, history: {yf_symbol: {"YYYY-MM-DD": close}}
+    def __init__(self, prices=None, infos=None, history=None, max_workers=8):
+        super().__init__(max_workers)
+        self.prices = prices or {}
+        self.infos = infos or {}
+        self.history = history or {}
+        self.calls = 0  # Number of requests served, so tests can check batching
+
+    def get_price(self, yf_symbol, date=None):
+        self.calls += 1
+        if not date:
+            return self.prices[yf_symbol]
+
+        closes = self.history.get(yf_symbol, {})
+        past_dates = [day for day in closes if day <= date]
+        if not past_dates:
+            raise KeyError(f"No price for {yf_symbol} on or before {date}")
+        return closes[max(past_dates)]
+
+    def get_info(self, yf_symbol):
+        self.calls += 1
+        return self.infos.get(yf_symbol, {})
+
+    def get_symbol_history(self, yf_symbol, start, end):
+        closes = self.history.get(yf_symbol, {})
+        return [(day, close, close, close, close, 0.0) for day, close in sorted(closes.items()) if start <= day <= end]
+
+    def get_history(self, yf_symbols, start, end):
+        self.calls += 1
+        return {yf_symbol: self.get_symbol_history(yf_symbol, start, end) for yf_symbol in dict.fromkeys(yf_symbols)}
+
+    def get_prices(self, yf_symbols, date=None):
+        # A local source answers a whole batch in one request
+        self.calls += 1
+        prices = {}
+        for yf_symbol in dict.fromkeys(yf_symbols):
+            if not date and yf_symbol in self.prices:
+                prices[yf_symbol] = self.prices[yf_symbol]
+            elif date:
+                closes = self.history.get(yf_symbol, {})
+                past_dates = [day for day in closes if day <= date]
+                if past_dates:
+                    prices[yf_symbol] = closes[max(past_dates)]
+        return prices
+
+
+class SyntheticPriceProvider(PriceProvider):
+    # Deterministic offline source for benchmarks: every symbol gets a stable price derived from its name,
+    # a plausible info dict and a daily random walk history, without any network or stored data
+    exchanges = {".IS": ("IST", "TRY"), "-USD": ("CCC", "USD"), "=F": ("CMX", "USD"), "=X": ("CCY", "TRY")}
+
+    def __init__(self, seed=0, max_workers=8):
+        super().__init__(max_workers)
+        self.seed = seed
+        self.calls = 0
+
+    def base_price(self, yf_symbol):
+        return 1 + zlib.crc32(f"{self.seed}:{yf_symbol}".encode()) % 100000 / 100
+
+    def close(self, yf_symbol, date):
+        # A smooth walk around the base price, the same for every run
+        day = datetime.strptime(date, "%Y-%m-%d").toordinal()
+        noise = zlib.crc32(f"{self.seed}:{yf_symbol}:{day}".encode()) % 2001 / 100000 - 0.01
+        return round(self.base_price(yf_symbol) * (1 + 0.1 * math.sin(day / 30) + noise), 4)
+
+    def get_price(self, yf_symbol, date=None):
+        self.calls += 1
+        if not date:
+            return self.base_price(yf_symbol)
+        day = datetime.strptime(date, "%Y-%m-%d")
+        while day.weekday() >= 5:  # Weekends use Friday's close
+            day -= timedelta(days=1)
+        return self.close(yf_symbol, day.strftime("%Y-%m-%d"))
+
+    def get_prices(self, yf_symbols, date=None):
+        self.calls += 1
+        return {yf_symbol: self.get_price(yf_symbol, date) for yf_symbol in dict.fromkeys(yf_symbols)}
+
+    def get_info(self, yf_symbol):
+        self.calls += 1
+        extension = next((extension for extension in SyntheticPriceProvider.exchanges if yf_symbol.endswith(extension)), None)
+        exchange, currency = SyntheticPriceProvider.exchanges.get(extension, ("NMS", "USD"))
+        return {"longName": f"{yf_symbol} Synthetic", "exchange": exchange, "currency": currency}
+
+    def get_symbol_history(self, yf_symbol, start, end):
+        bars = []
+        day = datetime.strptime(start, "%Y-%m-%d")
+        while day.strftime("%Y-%m-%d") <= end:
+            if day.weekday() < 5:
+                close = self.close(yf_symbol, day.strftime("%Y-%m-%d"))
+                bars.append((day.strftime("%Y-%m-%d"), close, close, close, close, 0.0))
+            day += timedelta(days=1)
+        return bars
+
+    def get_history(self, yf_symbols, start, end):
+        self.calls += 1
+        return {yf_symbol: self.get_symbol_history(yf_symbol, start, end) for yf_symbol in dict.fromkeys(yf_symbols)}
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import sqlite3 as sql
+import threading
+import json
+import time
+
+
+class QuoteCache:
+    # In-process quote cache with a freshness TTL (seconds). There is one entry per instrument, so by default the
+    # cache holds the whole working set; with maxsize the least recently used entries are evicted, but not while
+    # a batch() is open, so a report never evicts its own quotes.
+    # If db_path is given, entries are also written to an SQLite file so they survive across User sessions.
+    def __init__(self, ttl=60, maxsize=None, db_path=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # key -> (stored_at, value), most recently used last
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0  # Open batch() blocks, eviction waits until the last one ends
+
+        self.conn = None
+        if db_path:
+            self.conn = sql.connect(db_path, check_same_thread=False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS quote_cache ("
+                              "key TEXT PRIMARY KEY, "  # JSON encoded cache key
+                              "value TEXT, "  # JSON encoded quote
+                              "stored_at REAL)")  # Unix time the quote was fetched
+            self.conn.commit()
+
+    def is_fresh(self, stored_at):
+        return self.ttl is None or time.time() - stored_at <= self.ttl
+
+    def get(self, key):
+        # Return the cached value for key, or None if it is missing or stale
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and self.is_fresh(entry[0]):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            # Fall back to the persistent tier and promote fresh entries to memory
+            if self.conn:
+                row = self.conn.execute("SELECT value, stored_at FROM quote_cache WHERE key = ?",
+                                        (json.dumps(key),)).fetchone()
+                if row and self.is_fresh(row[1]):
+                    value = json.loads(row[0])
+                    self.store(key, value, row[1])
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self.lock:
+            stored_at = time.time()
+            self.store(key, value, stored_at)
+            if self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO quote_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                                  (json.dumps(key), json.dumps(value), stored_at))
+                self.conn.commit()
+
+    def store(self, key, value, stored_at):
+        # Insert into the memory tier and evict the least recently used entries over the size bound
+        self.entries[key] = (stored_at, value)
+        self.entries.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        while self.maxsize is not None and not self.batches and len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    @contextmanager
+    def batch(self):
+        # Keep every entry used inside the block, the size bound is applied again when the last block ends
+        with self.lock:
+            self.batches += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.batches -= 1
+                self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.conn:
+                self.conn.execute("DELETE FROM quote_cache")
+                self.conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = round(self.hits / lookups * 100, 2) if lookups else 0.0
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": hit_rate, "size": len(self.entries)}
@@ -0,0 +1,150 @@
+from concurrent.futures import ProcessPoolExecutor
+from _datetime import datetime, timedelta
+import numpy as np
+from Valuation import Valuation
+
+chunk_paths = 2500  # Monte Carlo paths per random stream, results do not depend on the number of workers
+
+
+def simulate(seed, mean, factor, values, paths):
+    # One chunk of Monte Carlo paths: correlated normal returns (paths x assets) times the position values
+    # (assets x buckets), returns the simulated profit/loss of every bucket (paths x buckets)
+    rng = np.random.default_rng(seed)
+    returns = rng.standard_normal((paths, len(mean))) @ factor.T + mean
+    return returns @ values
+
+
+class Risk:
+    # Risk figures of a portfolio and of each market bucket: volatility, beta, correlation and historical and
+    # Monte Carlo value at risk. Daily closes of every holding are loaded in one history request into a
+    # returns matrix (days x assets), all statistics are matrix operations over it.
+    trading_days = 252  # Used to annualize daily volatility
+
+    def __init__(self, portfolio, p_name, days=365, benchmark=("SPY", "America"), currency="TRY"):
+        # benchmark: (symbol, market) the betas are measured against, None to skip the betas
+        self.currency = currency
+        rows = portfolio.holdings(p_name)
+        pairs = [(row[0], row[5]) for row in rows]
+        end = datetime.now().strftime("%Y-%m-%d")
+        start = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+        # One history request for the holdings and the benchmark, then the stored closes
+        history_pairs = pairs + [benchmark] if benchmark else pairs
+        portfolio.history.ensure(history_pairs, start, end)
+        closes = portfolio.history.stored_closes(history_pairs, start, end)
+
+        # Holdings without any close in the period cannot be measured
+        self.missing = [pair[0] for pair in pairs if not closes[pair]]
+        if self.missing:
+            print(f"No price history for {', '.join(self.missing)}, left out of the risk figures.")
+        rows = [row for row, pair in zip(rows, pairs) if closes[pair]]
+        pairs = [(row[0], row[5]) for row in rows]
+        self.symbols = [row[0] for row in rows]
+        self.markets = [row[5] for row in rows]
+        if benchmark and not closes[benchmark]:
+            benchmark = None
+        history_pairs = pairs + [benchmark] if benchmark else pairs  # Columns of the matrices, the benchmark last
+
+        # Close matrix over the union of the trading days, forward filled over the days a market was closed
+        dates = sorted({date for pair in history_pairs for date, close in closes[pair]})
+        day_index = {date: i for i, date in enumerate(dates)}
+        prices = np.full((len(dates), len(history_pairs)), np.nan)
+        for column, pair in enumerate(history_pairs):
+            bars = closes[pair]
+            prices[[day_index[date] for date, close in bars], column] = [close for date, close in bars]
+        filled = np.where(np.isnan(prices), 0, np.arange(len(dates))[:, None])
+        prices = prices[np.maximum.accumulate(filled, axis=0), np.arange(len(history_pairs))]
+        prices = prices[~np.isnan(prices).any(axis=1)]  # Start when every holding and the benchmark have a close
+
+        returns = prices[1:] / prices[:-1] - 1
+        self.returns = returns[:, :len(pairs)]
+        self.benchmark_returns = returns[:, -1] if benchmark and len(returns) > 1 else None
+
+        # Position values in the reporting currency at the last close, per bucket: the whole portfolio first, then every market
+        rates = portfolio.fx.rates_to(currency, [row[4] for row in rows])
+        quantity = np.array([row[3] for row in rows], dtype=float)
+        fx = np.array([rates[row[4]] for row in rows], dtype=float)
+        self.value = prices[-1, :len(pairs)] * quantity * fx if len(prices) else np.zeros(len(pairs))
+        self.buckets = ["portfolio"] + [market for market in Valuation.markets if market in self.markets]
+        market_array = np.array(self.markets, dtype=object)
+        masks = np.column_stack([np.ones(len(pairs), dtype=bool)] +
+                                [market_array == market for market in self.buckets[1:]]).reshape(len(pairs), len(self.buckets))
+        self.bucket_values = self.value[:, None] * masks  # assets x buckets
+        totals = self.bucket_values.sum(axis=0)
+        self.bucket_weights = np.divide(self.bucket_values, totals, out=np.zeros_like(self.bucket_values), where=totals > 0)
+
+        self.mean = self.returns.mean(axis=0) if len(self.returns) else np.zeros(len(pairs))
+        self.covariance = np.atleast_2d(np.cov(self.returns, rowvar=False)) if len(self.returns) > 1 else np.zeros((len(pairs), len(pairs)))
+
+    def by_bucket(self, figures):
+        return dict(zip(self.buckets, np.asarray(figures, dtype=float).tolist()))
+
+    def volatility(self):
+        # Annualized volatility of every asset and of every bucket (portfolio and markets)
+        variances = np.einsum("ib,ij,jb->b", self.bucket_weights, self.covariance, self.bucket_weights)
+        return {"assets": dict(zip(self.symbols, np.sqrt(np.diag(self.covariance) * Risk.trading_days).tolist())),
+                "buckets": self.by_bucket(np.sqrt(np.maximum(variances, 0) * Risk.trading_days))}
+
+    def beta(self):
+        # Beta of every asset and bucket against the benchmark, None without benchmark history
+        if self.benchmark_returns is None:
+            return None
+        benchmark = self.benchmark_returns - self.benchmark_returns.mean()
+        betas = (self.returns - self.mean).T @ benchmark / (benchmark @ benchmark)
+        return {"assets": dict(zip(self.symbols, betas.tolist())), "buckets": self.by_bucket(self.bucket_weights.T @ betas)}
+
+    def correlation(self):
+        # Correlation matrix of the daily returns, rows and columns in the order of symbols
+        deviation = np.sqrt(np.diag(self.covariance))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlation = self.covariance / np.outer(deviation, deviation)
+        return {"symbols": self.symbols, "matrix": np.nan_to_num(correlation).tolist()}
+
+    def historical_var(self, confidence=0.95, horizon=1):
+        # Loss not exceeded with the given confidence over horizon days, from the observed daily returns
+        profit = self.returns @ self.bucket_values  # days x buckets
+        return self.by_bucket(-np.quantile(profit, 1 - confidence, axis=0) * np.sqrt(horizon))
+
+    def factor(self, horizon):
+        # Matrix F with F @ F.T equal to the covariance over horizon days. Cholesky when the covariance is
+        # positive definite, an eigen decomposition otherwise (e.g. more assets than observed days).
+        covariance = self.covariance * horizon
+        try:
+            return np.linalg.cholesky(covariance)
+        except np.linalg.LinAlgError:
+            eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+            return eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+
+    def monte_carlo_var(self, confidence=0.95, horizon=1, paths=10000, workers=None, seed=None):
+        # Value at risk from simulated multivariate normal returns. With workers the chunks of paths are
+        # simulated in a process pool (call it under `if __name__ == "__main__":` on Windows and macOS).
+        mean = self.mean * horizon
+        factor = self.factor(horizon)
+        sizes = [min(chunk_paths, paths - done) for done in range(0, paths, chunk_paths)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        arguments = (seeds, [mean] * len(sizes), [factor] * len(sizes),
+                     [self.bucket_values] * len(sizes), sizes)
+
+        if workers and workers > 1 and len(sizes) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunks = list(executor.map(simulate, *arguments))
+        else:
+            chunks = list(map(simulate, *arguments))
+        profit = np.concatenate(chunks)  # paths x buckets
+        return self.by_bucket(-np.quantile(profit, 1 - confidence, axis=0))
+
+    def report(self, confidence=0.95, horizon=1, paths=10000, workers=None, seed=None):
+        # Every figure per bucket: {"portfolio": {...}, "America": {...}, ...}, plus the asset correlation matrix
+        volatility = self.volatility()["buckets"]
+        beta = self.beta()
+        historical = self.historical_var(confidence, horizon)
+        monte_carlo = self.monte_carlo_var(confidence, horizon, paths, workers, seed)
+        values = self.by_bucket(self.bucket_values.sum(axis=0))
+        report = {bucket: {"value": values[bucket],
+                           "volatility": volatility[bucket],
+                           "beta": beta["buckets"][bucket] if beta else None,
+                           "historical_var": historical[bucket],
+                           "monte_carlo_var": monte_carlo[bucket]}
+                  for bucket in self.buckets}
+        report["correlation"] = self.correlation()
+        return report
@@ -0,0 +1,217 @@
+from _datetime import datetime, timedelta
+
+
+class Snapshots:
+    # Materialized daily NAV of every portfolio: one row per portfolio per day with market value, cost basis,
+    # realized and unrealized P/L in TRY, plus per-market totals. Trades mark the snapshots dirty from their
+    # date and only the days from that date onward are recomputed, so range queries are plain table reads.
+    def __init__(self, user, history, lots, fx):
+        self.user = user
+        self.conn = user.conn
+        self.cursor = user.cursor
+        self.history = history  # PriceHistory used for the daily closes and exchange rates
+        self.lots = lots  # Lots holding the cost basis each sell was matched against
+        self.fx = fx  # FX converting every holding currency to TRY at the day's rate
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS nav_snapshots ("
+                            "portfolio_id INTEGER, "
+                            "date TEXT, "  # Day of the snapshot (YYYY-MM-DD)
+                            "market_value REAL, "  # Value of the holdings at the day's close
+                            "cost_basis REAL, "  # Average cost of the holdings
+                            "realized_pl REAL, "  # Profit/loss realized by sells up to that day
+                            "unrealized_pl REAL, "  # market_value - cost_basis
+                            "PRIMARY KEY (portfolio_id, date)) WITHOUT ROWID")
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS nav_snapshot_markets ("
+                            "portfolio_id INTEGER, "
+                            "date TEXT, "
+                            "market TEXT, "
+                            "market_value REAL, "
+                            "cost_basis REAL, "
+                            "PRIMARY KEY (portfolio_id, date, market)) WITHOUT ROWID")
+        # Earliest day that has to be recomputed and the last day built, per portfolio
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS nav_snapshot_state ("
+                            "portfolio_id INTEGER PRIMARY KEY, "
+                            "dirty_from TEXT, "
+                            "built_through TEXT)")
+
+    def mark_dirty(self, portfolio_id, date):
+        # Called for every recorded trade, runs inside the trade's transaction
+        self.cursor.execute("INSERT INTO nav_snapshot_state (portfolio_id, dirty_from) VALUES (?, ?) "
+                            "ON CONFLICT (portfolio_id) DO UPDATE SET "
+                            "dirty_from = min(coalesce(dirty_from, excluded.dirty_from), excluded.dirty_from)",
+                            (portfolio_id, date))
+
+    def update(self, portfolio_id):
+        # Bring the snapshots of a portfolio up to today, recomputing only what changed
+        self.cursor.execute("SELECT dirty_from, built_through FROM nav_snapshot_state WHERE portfolio_id = ?", (portfolio_id,))
+        state = self.cursor.fetchone()
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        if not state or not state[1]:
+            self.rebuild(portfolio_id)
+        elif state[0]:
+            self.rebuild(portfolio_id, min(state[0], state[1]))
+        elif state[1] < today:
+            self.rebuild(portfolio_id, state[1])  # The last built day may have used an intraday price
+
+    def rebuild(self, portfolio_id, since=None):
+        # Recompute the snapshots from since (or from the first trade) up to today
+        self.cursor.execute("SELECT min(date) FROM trades WHERE portfolio_id = ?", (portfolio_id,))
+        first_date = self.cursor.fetchone()[0]
+        today = datetime.now().strftime("%Y-%m-%d")
+        if not first_date:
+            with self.user.transaction():
+                self.delete(portfolio_id)
+            return
+
+        start = max(since or first_date, first_date)
+        self.lots.method(portfolio_id)  # Make sure the realized profit of every sell is stored
+
+        # Holdings before the first recomputed day: symbol -> [quantity, cost basis, market, currency]
+        positions = {}
+        self.cursor.execute("SELECT t.action, t.symbol, t.exchange, t.currency, t.cost, t.quantity, r.cost_basis FROM trades t "
+                            "LEFT JOIN realized_pl r ON r.trade_id = t.trade_id "
+                            "WHERE t.portfolio_id = ? AND t.date < ? ORDER BY t.date, t.trade_id", (portfolio_id, start))
+        for action, symbol, market, currency, cost, quantity, cost_basis in self.cursor.fetchall():
+            Snapshots.apply_trade(positions, action, symbol, market, currency, cost, quantity, cost_basis)
+
+        # The realized P/L up to that day comes from the last snapshot that is kept
+        self.cursor.execute("SELECT realized_pl FROM nav_snapshots WHERE portfolio_id = ? AND date < ? "
+                            "ORDER BY date DESC LIMIT 1", (portfolio_id, start))
+        row = self.cursor.fetchone()
+        realized = row[0] if row else 0.0
+
+        self.cursor.execute("SELECT t.date, t.action, t.symbol, t.exchange, t.currency, t.cost, t.quantity, r.cost_basis FROM trades t "
+                            "LEFT JOIN realized_pl r ON r.trade_id = t.trade_id "
+                            "WHERE t.portfolio_id = ? AND t.date >= ? ORDER BY t.date, t.trade_id", (portfolio_id, start))
+        trades = self.cursor.fetchall()
+
+        # Daily closes of every symbol held in the period and of the exchange rates, in one history request
+        pairs = {(symbol, position[2]) for symbol, position in positions.items()}
+        pairs.update((trade[2], trade[3]) for trade in trades)
+        currencies = {position[3] for position in positions.values()} | {trade[4] for trade in trades} | {"TRY"}
+        self.fx.add(currencies)
+        fx_pairs = self.fx.pairs()
+        lookback = (datetime.strptime(start, "%Y-%m-%d") - timedelta(days=15)).strftime("%Y-%m-%d")
+        self.history.ensure(pairs | set(fx_pairs), lookback, today)
+        closes = self.history.stored_closes(pairs, lookback, today)
+        self.fx.fill(self.history.stored_closes(fx_pairs, lookback, today), start, today)
+        last_close = {}
+        next_bar = dict.fromkeys(pairs, 0)
+
+        snapshot_rows = []
+        market_rows = []
+        trade_index = 0
+        day = datetime.strptime(start, "%Y-%m-%d")
+        while day.strftime("%Y-%m-%d") <= today:
+            date = day.strftime("%Y-%m-%d")
+
+            # Move every close forward to the last bar on or before this day
+            for pair, bars in closes.items():
+                while next_bar[pair] < len(bars) and bars[next_bar[pair]][0] <= date:
+                    last_close[pair] = bars[next_bar[pair]][1]
+                    next_bar[pair] += 1
+            rates = self.fx.rates_to("TRY", currencies, date)
+
+            # Apply the day's trades, sells realize profit against the lots they were matched with
+            while trade_index < len(trades) and trades[trade_index][0] == date:
+                action, symbol, market, currency, cost, quantity, cost_basis = trades[trade_index][1:]
+                profit = Snapshots.apply_trade(positions, action, symbol, market, currency, cost, quantity, cost_basis)
+                realized += profit * rates[currency]
+                trade_index += 1
+
+            market_value = 0.0
+            cost_basis = 0.0
+            markets = {}
+            for symbol, (quantity, cost, market, currency) in positions.items():
+                fx = rates[currency]
+                price = last_close.get((symbol, market), cost / quantity)
+                value = quantity * price * fx
+                market_value += value
+                cost_basis += cost * fx
+                market_totals = markets.setdefault(market, [0.0, 0.0])
+                market_totals[0] += value
+                market_totals[1] += cost * fx
+
+            snapshot_rows.append((portfolio_id, date, round(market_value, 2), round(cost_basis, 2),
+                                  round(realized, 2), round(market_value - cost_basis, 2)))
+            market_rows.extend((portfolio_id, date, market, round(value, 2), round(cost, 2))
+                               for market, (value, cost) in markets.items())
+            day += timedelta(days=1)
+
+        with self.user.transaction():
+            self.cursor.execute("DELETE FROM nav_snapshots WHERE portfolio_id = ? AND date >= ?", (portfolio_id, start))
+            self.cursor.execute("DELETE FROM nav_snapshot_markets WHERE portfolio_id = ? AND date >= ?", (portfolio_id, start))
+            self.cursor.executemany("INSERT INTO nav_snapshots VALUES (?, ?, ?, ?, ?, ?)", snapshot_rows)
+            self.cursor.executemany("INSERT INTO nav_snapshot_markets VALUES (?, ?, ?, ?, ?)", market_rows)
+            self.cursor.execute("INSERT OR REPLACE INTO nav_snapshot_state (portfolio_id, dirty_from, built_through) "
+                                "VALUES (?, NULL, ?)", (portfolio_id, today))
+
+    @staticmethod
+    def apply_trade(positions, action, symbol, market, currency, cost, quantity, cost_basis=None):
+        # Update the positions with one trade and return the profit it realized in the trade currency.
+        # cost_basis is the cost of the lots a sell was matched with, the average cost is used without it.
+        position = positions.get(symbol)
+        if action == "buy":
+            if position:
+                position[0] += quantity
+                position[1] += cost * quantity
+            else:
+                positions[symbol] = [quantity, cost * quantity, market, currency]
+            return 0.0
+
+        if not position:
+            return 0.0
+        quantity = min(quantity, position[0])
+        if cost_basis is None:
+            cost_basis = position[1] / position[0] * quantity
+        position[0] -= quantity
+        position[1] -= cost_basis
+        if position[0] <= 0:
+            del positions[symbol]
+        return cost * quantity - cost_basis
+
+    def delete(self, portfolio_id):
+        self.cursor.execute("DELETE FROM nav_snapshots WHERE portfolio_id = ?", (portfolio_id,))
+        self.cursor.execute("DELETE FROM nav_snapshot_markets WHERE portfolio_id = ?", (portfolio_id,))
+        self.cursor.execute("DELETE FROM nav_snapshot_state WHERE portfolio_id = ?", (portfolio_id,))
+
+    def range(self, portfolio_id, start, end):
+        # Daily snapshots between two dates, oldest first
+        self.update(portfolio_id)
+        self.cursor.execute("SELECT date, market_value, cost_basis, realized_pl, unrealized_pl FROM nav_snapshots "
+                            "WHERE portfolio_id = ? AND date BETWEEN ? AND ? ORDER BY date", (portfolio_id, start, end))
+        return [{"date": date, "market_value": market_value, "cost_basis": cost_basis,
+                 "realized_pl": realized_pl, "unrealized_pl": unrealized_pl}
+                for date, market_value, cost_basis, realized_pl, unrealized_pl in self.cursor.fetchall()]
+
+    def markets(self, portfolio_id, date):
+        # Per-market totals of one day
+        self.update(portfolio_id)
+        self.cursor.execute("SELECT market, market_value, cost_basis FROM nav_snapshot_markets "
+                            "WHERE portfolio_id = ? AND date = ?", (portfolio_id, date))
+        return {market: {"market_value": market_value, "cost_basis": cost_basis}
+                for market, market_value, cost_basis in self.cursor.fetchall()}
+
+    def value_on(self, portfolio_id, date):
+        # Snapshot of the last day on or before date, None before the first trade
+        self.update(portfolio_id)
+        self.cursor.execute("SELECT date, market_value, cost_basis, realized_pl, unrealized_pl FROM nav_snapshots "
+                            "WHERE portfolio_id = ? AND date <= ? ORDER BY date DESC LIMIT 1", (portfolio_id, date))
+        row = self.cursor.fetchone()
+        if not row:
+            return None
+        return {"date": row[0], "market_value": row[1], "cost_basis": row[2], "realized_pl": row[3], "unrealized_pl": row[4]}
+
+    def period_return(self, portfolio_id, days):
+        # Total P/L (realized + unrealized) over the last days, as an amount and as a percentage of today's value
+        today = datetime.now().strftime("%Y-%m-%d")
+        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        end = self.value_on(portfolio_id, today)
+        start = self.value_on(portfolio_id, start_date)
+        if not end:
+            return {"p_l": 0.0, "percentage": 0.0, "days": days}
+
+        start_pl = start["realized_pl"] + start["unrealized_pl"] if start else 0.0
+        p_l = round(end["realized_pl"] + end["unrealized_pl"] - start_pl, 2)
+        percentage = round(p_l / end["market_value"] * 100, 2) if end["market_value"] else 0.0
+        return {"p_l": p_l, "percentage": percentage, "days": days}
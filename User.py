@@ -1,48 +1,172 @@
+from contextlib import contextmanager
+from Instrumentation import TracedCursor, timed
 import sqlite3 as sql
 
 class User:
-    def __init__(self, user):
+    def __init__(self, user, tune=False, busy_timeout=5000, cached_statements=256):
         self.user = user
-        self.conn = sql.connect(f"{user}.db")  # Connect to the SQLite database
-        self.cursor = self.conn.cursor()  # Cursor for executing SQL queries
+        self.transaction_depth = 0  # Nesting level of transaction() blocks
+        self.open_lots = {}  # (portfolio_id, symbol) -> OpenLots of the lots table, shared by every Portfolio on this connection
 
+        if tune:
+            # Tuned connection: WAL lets readers (e.g. a dashboard) work while a writer records trades
+            self.conn = sql.connect(f"{user}.db", timeout=busy_timeout / 1000, cached_statements=cached_statements)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+        else:
+            self.conn = sql.connect(f"{user}.db")  # Connect to the SQLite database
+        self.cursor = self.conn.cursor(TracedCursor)  # Cursor for executing SQL queries, timed when instrumentation is enabled
+        self.create_schema()
+        self.migrate()
+
+    @contextmanager
+    def transaction(self):
+        # Unit of work: everything inside the block is committed together or rolled back on error.
+        # Nested blocks become savepoints of the outer transaction.
+        if self.transaction_depth:
+            savepoint = f"sp_{self.transaction_depth}"
+            self.conn.execute(f"SAVEPOINT {savepoint}")
+            self.transaction_depth += 1
+            try:
+                yield self.cursor
+            except BaseException:
+                self.conn.execute(f"ROLLBACK TO {savepoint}")
+                self.open_lots.clear()  # Reloaded from the rolled back table on next use
+                raise
+            finally:
+                self.transaction_depth -= 1
+                self.conn.execute(f"RELEASE {savepoint}")
+            return
+
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN IMMEDIATE")  # Take the write lock up front instead of failing half way
+        self.transaction_depth += 1
+        try:
+            yield self.cursor
+        except BaseException:
+            self.conn.rollback()
+            self.open_lots.clear()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self.transaction_depth -= 1
+
+    def create_schema(self):
+        # One table for every kind of record, keyed by portfolio_id instead of one table per portfolio
+        self.cursor.execute('''CREATE TABLE IF NOT EXISTS portfolios (
+                    portfolio_id INTEGER PRIMARY KEY,
+                    name TEXT UNIQUE NOT NULL
+                )''')
+        self.cursor.execute('''CREATE TABLE IF NOT EXISTS holdings (
+                    portfolio_id INTEGER NOT NULL REFERENCES portfolios (portfolio_id),
+                    symbol TEXT NOT NULL,
+                    name TEXT,
+                    cost REAL,
+                    quantity REAL,
+                    exchange TEXT,
+                    market TEXT,
+                    PRIMARY KEY (portfolio_id, symbol)
+                )''')
+        self.cursor.execute('''CREATE TABLE IF NOT EXISTS trades (
+                    trade_id INTEGER PRIMARY KEY,
+                    portfolio_id INTEGER NOT NULL REFERENCES portfolios (portfolio_id),
+                    date DATE,
+                    action TEXT,
+                    symbol TEXT,
+                    s_name TEXT,
+                    exchange TEXT,
+                    currency TEXT,
+                    cost REAL,
+                    quantity REAL
+                )''')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS holdings_symbol ON holdings (symbol, portfolio_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS trades_portfolio_date ON trades (portfolio_id, date)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS trades_portfolio_symbol ON trades (portfolio_id, symbol, date)")
+        self.conn.commit()
+
+    def migrate(self):
+        # One-shot migration from the old layout with a {name} and {name}_trade_history table per portfolio
+        legacy = []
+        for table in self.tables():
+            self.cursor.execute(f"PRAGMA table_info('{table}')")
+            columns = [column[1] for column in self.cursor.fetchall()]
+            if columns == ["symbol", "name", "cost", "quantity", "exchange", "market"]:
+                legacy.append(table)
+        if not legacy:
+            return
+
+        tables = self.tables()
+        with self.transaction():
+            for name in legacy:
+                self.cursor.execute("INSERT OR IGNORE INTO portfolios (name) VALUES (?)", (name,))
+                portfolio_id = self.portfolio_id(name)
+                self.cursor.execute(f"INSERT OR REPLACE INTO holdings (portfolio_id, symbol, name, cost, quantity, exchange, market) "
+                                    f"SELECT ?, symbol, name, cost, quantity, exchange, market FROM \"{name}\"", (portfolio_id,))
+                self.cursor.execute(f"DROP TABLE \"{name}\"")
+
+                if f"{name}_trade_history" in tables:
+                    self.cursor.execute(f"INSERT INTO trades (portfolio_id, date, action, symbol, s_name, exchange, currency, cost, quantity) "
+                                        f"SELECT ?, date, action, symbol, s_name, exchange, currency, cost, quantity "
+                                        f"FROM \"{name}_trade_history\" ORDER BY rowid", (portfolio_id,))
+                    self.cursor.execute(f"DROP TABLE \"{name}_trade_history\"")
+        print(f"{len(legacy)} portfolios migrated to the new database layout.")
+
+    @timed("report.tables")
     def tables(self):
         # Fetch and return all table names from the database
         self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
         return [table[0] for table in self.cursor.fetchall()]
 
+    def portfolios(self):
+        # Names of all portfolios in the database
+        self.cursor.execute("SELECT name FROM portfolios ORDER BY portfolio_id")
+        return [portfolio[0] for portfolio in self.cursor.fetchall()]
+
+    def portfolio_id(self, name):
+        # Return the id of a portfolio, or None if it doesn't exist
+        self.cursor.execute("SELECT portfolio_id FROM portfolios WHERE name = ?", (name,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def holdings_of(self, symbol):
+        # Every holding of a symbol across all portfolios, with a single indexed query
+        self.cursor.execute("SELECT portfolios.name, holdings.symbol, holdings.cost, holdings.quantity, "
+                            "holdings.exchange, holdings.market "
+                            "FROM holdings JOIN portfolios USING (portfolio_id) WHERE holdings.symbol = ?", (symbol,))
+        return self.cursor.fetchall()
+
     def create_new_portfolio(self, name):
         # Create a new portfolio if it doesn't exist
-        if name in self.tables():
+        if self.portfolio_id(name) is not None:
             print(f"You have a portfolio named {name}")  # Notify user if portfolio exists
             return
 
-        # SQL query to create a new portfolio table
-        text = '''CREATE TABLE IF NOT EXISTS {} (
-                    symbol TEXT,
-                    name TEXT,
-                    cost REAL,
-                    quantity REAL, 
-                    exchange TEXT,
-                    market TEXT
-                )'''
-        text = text.format(name)  # Format table name into SQL query
-        self.cursor.execute(text)
-        self.conn.commit()
+        with self.transaction():
+            self.cursor.execute("INSERT INTO portfolios (name) VALUES (?)", (name,))
         print(f"{name} portfolio has been created successfully.")
 
     def delete_the_portfolio(self, name):
-        # Delete a portfolio if it exists
-        if name not in self.tables():
-            print(f"Portfolio not found: Portfolios {self.tables()}")  # Notify if portfolio doesn't exist
-            return
-        self.cursor.execute(f"DROP TABLE {name}")  # Drop the table from the database
-        self.conn.commit()  # Commit the changes
+        # Delete a portfolio if it exists, returns whether it was deleted
+        portfolio_id = self.portfolio_id(name)
+        if portfolio_id is None:
+            print(f"Portfolio not found: Portfolios {self.portfolios()}")  # Notify if portfolio doesn't exist
+            return False
+        with self.transaction():  # Remove the holdings and trade history together with the portfolio
+            self.cursor.execute("DELETE FROM holdings WHERE portfolio_id = ?", (portfolio_id,))
+            self.cursor.execute("DELETE FROM trades WHERE portfolio_id = ?", (portfolio_id,))
+            self.cursor.execute("DELETE FROM portfolios WHERE portfolio_id = ?", (portfolio_id,))
+            for table in ("nav_snapshots", "nav_snapshot_markets", "nav_snapshot_state", "lots", "realized_pl", "lot_methods"):
+                if table in self.tables():
+                    self.cursor.execute(f"DELETE FROM {table} WHERE portfolio_id = ?", (portfolio_id,))
+            for key in [key for key in self.open_lots if key[0] == portfolio_id]:
+                del self.open_lots[key]  # The id can be reused by the next portfolio
         print(f"Your {name} portfolio has been successfully deleted.")  # Success message
+        return True
 
     def close_conn(self):
         # Commit and close the database connection
         self.conn.commit()
         self.conn.close()
         print("The database connection was closed.")  # Closing message
-
@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class Valuation:
+    # Columnar valuation of a portfolio table. Holdings are loaded into NumPy arrays, prices and the
+    # exchange rates are joined in as vectors and all totals and weights are computed in one vectorized pass.
+    markets = ["America", "BIST", "Crypto Market", "Commodity"]
+    market_exchanges = {"America": "$", "BIST": "₺", "Crypto Market": "$", "Commodity": "$"}
+
+    def __init__(self, rows, prices, tryusd_exchange=1.0, rates=None, currency="TRY"):
+        # rows: portfolio table rows (symbol, name, cost, quantity, exchange, market)
+        # prices: {(symbol, market): last price}, tryusd_exchange: TRY per USD
+        # rates: {currency: value of one unit in the reporting currency}, e.g. from FX.rates_to. Without it the
+        # report is in TRY, with USD holdings converted at tryusd_exchange and every other currency taken as TRY.
+        market_codes = {market: code for code, market in enumerate(Valuation.markets)}
+        count = len(rows)
+
+        self.symbols = [row[0] for row in rows]
+        self.cost = np.fromiter((row[2] for row in rows), dtype=float, count=count)
+        self.quantity = np.fromiter((row[3] for row in rows), dtype=float, count=count)
+        # Conversion factor per currency group, spread to the rows through the group index
+        currencies, groups = np.unique(np.array([row[4] for row in rows], dtype=str), return_inverse=True)
+        rates = rates if rates is not None else {"USD": tryusd_exchange}
+        self.fx = np.array([rates.get(code, 1.0) for code in currencies.tolist()], dtype=float)[groups.reshape(-1)]
+        self.market = np.fromiter((market_codes[row[5]] for row in rows), dtype=np.int64, count=count)
+        self.last_p = np.fromiter((prices[(row[0], row[5])] for row in rows), dtype=float, count=count)
+        self.tryusd_exchange = rates.get("USD", tryusd_exchange)
+        self.currency = currency
+        self.revalue()
+
+    def revalue(self, last_p=None):
+        # Recompute every figure from the current price vector, optionally replacing it first
+        if last_p is not None:
+            self.last_p = np.asarray(last_p, dtype=float)
+
+        # Per stock values in their own currency, rounded like the stock rows of the report
+        self.total = np.round(self.quantity * self.last_p, 2)
+        self.p_l = np.round((self.last_p - self.cost) * self.quantity, 2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.p_l_percentage = np.round((self.last_p - self.cost) / self.cost * 100, 2)
+
+        # General totals in the reporting currency
+        self.value_try = self.total * self.fx
+        self.profit_try = self.p_l * self.fx
+        self.portfolio_value = float(self.value_try.sum())
+        self.total_profit = float(self.profit_try.sum())
+        self.profit_percentage = round(self.total_profit / self.portfolio_value * 100, 2) if self.portfolio_value > 0 else 0.0
+
+        # Market totals in the market's own currency and weights in the reporting currency
+        market_count = len(Valuation.markets)
+        self.market_total = np.bincount(self.market, weights=self.total, minlength=market_count)
+        self.market_profit = np.bincount(self.market, weights=self.p_l, minlength=market_count)
+
+        if self.portfolio_value > 0:
+            market_value = np.bincount(self.market, weights=self.value_try, minlength=market_count)
+            self.market_percentage = np.round(market_value / self.portfolio_value * 100, 2)
+            self.stock_percentage = np.round(self.value_try / self.portfolio_value * 100, 2)
+        else:
+            self.market_percentage = np.zeros(market_count)
+            self.stock_percentage = np.zeros(len(self.symbols))
+
+    def to_infos(self):
+        # The all_infos dictionary returned by Portfolio.portfolio_infos
+        all_infos = {
+            "general": {
+                "portfolio_value": self.portfolio_value,
+                "total_profit": self.total_profit,
+                "profit_percentage": self.profit_percentage,
+                "currency": self.currency,
+            }
+        }
+        market_total = self.market_total.tolist()
+        market_profit = self.market_profit.tolist()
+        market_percentage = self.market_percentage.tolist()
+        for code, market in enumerate(Valuation.markets):
+            all_infos[market] = {"total": market_total[code], "profit": market_profit[code],
+                                 "exchange": Valuation.market_exchanges[market],
+                                 "portfolio_percentage": market_percentage[code], "stocks": []}
+
+        columns = zip(self.symbols, self.cost.tolist(), self.quantity.tolist(), self.last_p.tolist(), self.total.tolist(),
+                      self.p_l.tolist(), self.p_l_percentage.tolist(), self.stock_percentage.tolist(), self.market.tolist())
+        for symbol, cost, quantity, last_p, total, p_l, percentage, portfolio_percentage, code in columns:
+            all_infos[Valuation.markets[code]]["stocks"].append({
+                "symbol": symbol,
+                "cost": cost,
+                "quantity": quantity,
+                "last_p": last_p,
+                "total": total,
+                "p_l": p_l,
+                "p_l_percentage": percentage,
+                "portfolio_percentage": portfolio_percentage})
+
+        return all_infos
@@ -0,0 +1,179 @@
+# Offline benchmarks for the hot paths of User and Portfolio.
+# Prices come from SyntheticPriceProvider, so timings are not affected by the network.
+#
+#   python benchmarks/run_benchmarks.py                          # small sizes, print the results
+#   python benchmarks/run_benchmarks.py --full --save base.json  # up to 100k positions, 1M trades and 500 risk assets
+#   python benchmarks/run_benchmarks.py --compare base.json      # fail if a benchmark got slower
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from _datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from User import User
+from Portfolio import Portfolio
+from PriceProvider import SyntheticPriceProvider
+from QuoteCache import QuoteCache
+from Risk import Risk
+
+MARKETS = [("BIST", "TRY"), ("America", "USD"), ("Crypto Market", "USD"), ("Commodity", "USD")]
+POSITIONS = {"small": [10, 1000, 10000], "full": [10, 1000, 10000, 100000]}
+TRADES = {"small": [1000, 10000, 100000], "full": [1000, 10000, 100000, 1000000]}
+RISK_ASSETS = {"small": 100, "full": 500}
+
+
+def measure(function, repeat, setup=None):
+    # Run function repeat times with its output hidden, return the min and median duration in seconds
+    durations = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - start)
+    return {"min": min(durations), "median": statistics.median(durations)}
+
+
+def portfolio_with_positions(user, name, count):
+    # A portfolio holding count distinct symbols spread over the markets
+    with contextlib.redirect_stdout(io.StringIO()):
+        user.create_new_portfolio(name)
+    portfolio_id = user.portfolio_id(name)
+    rows = []
+    for index in range(count):
+        market, currency = MARKETS[index % len(MARKETS)]
+        rows.append((portfolio_id, f"S{index}", f"S{index} Synthetic", 10 + index % 90, 1 + index % 50, currency, market))
+    with user.transaction():
+        user.cursor.executemany("INSERT INTO holdings (portfolio_id, symbol, name, cost, quantity, exchange, market) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def portfolio_with_trades(user, name, count, symbols=500):
+    # A portfolio whose trades table has count rows over about three years, mostly buys with some sells
+    with contextlib.redirect_stdout(io.StringIO()):
+        user.create_new_portfolio(name)
+    portfolio_id = user.portfolio_id(name)
+    first_day = datetime.now() - timedelta(days=3 * 365)
+    quantities = {}
+    trades = []
+    for index in range(count):
+        symbol = f"T{index % symbols}"
+        market, currency = MARKETS[index % symbols % len(MARKETS)]
+        date = (first_day + timedelta(days=index * 3 * 365 // count)).strftime("%Y-%m-%d")
+        action = "sell" if index % 4 == 3 and quantities.get(symbol, 0) >= 1 else "buy"
+        quantities[symbol] = quantities.get(symbol, 0) + (1 if action == "buy" else -1)
+        trades.append((portfolio_id, date, action, symbol, f"{symbol} Synthetic", market, currency, 10 + index % 90, 1))
+
+    holdings = [(portfolio_id, symbol, f"{symbol} Synthetic", 50, quantity,
+                 MARKETS[int(symbol[1:]) % len(MARKETS)][1], MARKETS[int(symbol[1:]) % len(MARKETS)][0])
+                for symbol, quantity in quantities.items() if quantity > 0]
+    with user.transaction():
+        user.cursor.executemany("INSERT INTO trades (portfolio_id, date, action, symbol, s_name, exchange, currency, cost, quantity) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", trades)
+        user.cursor.executemany("INSERT INTO holdings (portfolio_id, symbol, name, cost, quantity, exchange, market) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)", holdings)
+    return first_day.strftime("%Y-%m-%d")
+
+
+def run(size, repeat):
+    Portfolio.use_provider(SyntheticPriceProvider())
+    results = {}
+
+    def cold_cache():
+        Portfolio.use_cache(QuoteCache())
+
+    for count in POSITIONS[size]:
+        user = User(f"bench_positions_{count}")
+        portfolio = Portfolio(user)
+        portfolio_with_positions(user, "bench", count)
+        times = max(1, repeat if count <= 10000 else repeat // 2)
+
+        results[f"portfolio_infos[{count} positions]"] = measure(lambda: portfolio.portfolio_infos("bench"), times, cold_cache)
+        results[f"buy_stock[{count} positions]"] = measure(lambda: portfolio.buy_stock("bench", "S1", 20, 1, "America"), times * 10)
+        results[f"sell_stock[{count} positions]"] = measure(lambda: portfolio.sell_stock("bench", "S1", 25, 1, "America"), times * 10)
+        results[f"User.tables[{count} positions]"] = measure(user.tables, times * 10)
+        user.conn.close()
+
+    for count in TRADES[size]:
+        user = User(f"bench_trades_{count}")
+        portfolio = Portfolio(user)
+        first_date = portfolio_with_trades(user, "bench", count)
+        times = max(1, repeat if count <= 100000 else repeat // 2)
+
+        results[f"portfolio_status_date[{count} trades]"] = measure(
+            lambda: portfolio.portfolio_status_date("bench", first_date), times, cold_cache)
+        user.conn.close()
+
+    # Risk figures over a year of daily closes, the history is generated once before the timing
+    count = RISK_ASSETS[size]
+    user = User(f"bench_risk_{count}")
+    portfolio = Portfolio(user)
+    portfolio_with_positions(user, "bench", count)
+    Risk(portfolio, "bench")
+    results[f"Risk[{count} assets]"] = measure(lambda: Risk(portfolio, "bench"), repeat)
+    risk = Risk(portfolio, "bench")
+    results[f"monte_carlo_var[{count} assets, 10k paths]"] = measure(lambda: risk.monte_carlo_var(paths=10000, seed=0), repeat)
+    user.conn.close()
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Print the change against the baseline and return the names of the benchmarks that got slower
+    regressions = []
+    print(f"{'benchmark':<45} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<45} {'-':>10} {result['median'] * 1000:>9.2f}ms {'new':>7}")
+            continue
+        ratio = result["median"] / baseline[name]["median"]
+        flag = " <-- slower" if ratio > threshold else ""
+        print(f"{name:<45} {baseline[name]['median'] * 1000:>9.2f}ms {result['median'] * 1000:>9.2f}ms {ratio:>6.2f}x{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Portfolio Tracker benchmarks")
+    parser.add_argument("--full", action="store_true", help="include 100k positions, 1M trades and 500 risk assets")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against a JSON file written by --save")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)  # User creates its database file in the working directory
+        try:
+            results = run("full" if args.full else "small", args.repeat)
+        finally:
+            os.chdir(cwd)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks are slower than the baseline.")
+            sys.exit(1)
+    else:
+        for name, result in results.items():
+            print(f"{name:<45} min {result['min'] * 1000:>9.2f}ms  median {result['median'] * 1000:>9.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,108 @@
+# Command line interface of the portfolio tracker.
+#
+#   python main.py list
+#   python main.py create Enes_Capital_Portföy
+#   python main.py buy Enes_Capital_Portföy THYAO 300.25 30 BIST
+#   python main.py sell Enes_Capital_Portföy THYAO 301.25 10 BIST
+#   python main.py status Enes_Capital_Portföy [--date 2025-04-08]
+#   python main.py period Enes_Capital_Portföy 30
+#   python main.py delete Enes_Capital_Portföy
+#
+# Portfolio management only needs the database, so Portfolio (and with it the price provider, yfinance and
+# NumPy) is imported by the commands that record trades or price the holdings.
+import argparse
+import sys
 from User import User
-from Portfolio import Portfolio
 
-# Creating a user "enes"
-User = User("Enes")
+markets = ["BIST", "America", "Crypto Market", "Commodity"]  # Same keys as Portfolio.get_extension
 
-# Creating portfolios for the user
-Portfolios = Portfolio(User)
 
-# A new portfolio is created: "Enes_Capital_Portföy"
-User.create_new_portfolio("Enes_Capital_Portföy")
+def list_portfolios(user, args):
+    portfolios = user.portfolios()
+    if not portfolios:
+        print("You have no portfolios yet.")
+    for name in portfolios:
+        print(name)
 
-# Adding stocks to the "Enes_Capital_Portföy" portfolio
-Portfolios.buy_stock("Enes_Capital_Portföy", "THYAO", 300.25, 30, "BIST")  # Buying Turkish Airlines (THYAO) from BIST
-Portfolios.buy_stock("Enes_Capital_Portföy", "BTC", 78123.26, 0.01, "Crypto Market")  # Buying Bitcoin (BTC) from Crypto Market
-Portfolios.buy_stock("Enes_Capital_Portföy", "TSLA", 232.01, 0.6, "America")  # Buying Tesla (TSLA) from the American stock market
-Portfolios.buy_stock("Enes_Capital_Portföy", "SI", 29.93, 0.6, "Commodity")  # Buying Silver (SI) from Commodity market
 
-# Selling stocks from "Enes_Capital_Portföy" portfolio
-Portfolios.sell_stock("Enes_Capital_Portföy", "THYAO", 301.25, 10, "BIST")  # Selling 10 shares of THYAO from BIST
+def create_portfolio(user, args):
+    user.create_new_portfolio(args.name)
 
-# Viewing the current status of "Enes_Capital_Portföy" portfolio
-Portfolios.portfolio_status("Enes_Capital_Portföy")
 
-# Viewing the portfolio status of "Enes_Capital_Portföy" on a specific date (2025-04-08)
-Portfolios.portfolio_status_date("Enes_Capital_Portföy", "2025-04-08")
+def delete_portfolio(user, args):
+    if not user.delete_the_portfolio(args.name):
+        return 1
 
-# Closing the connection
-User.close_conn()
+
+def trade(user, args):
+    from Portfolio import Portfolio
+    portfolio = Portfolio(user)
+    if args.command == "buy":
+        portfolio.buy_stock(args.name, args.symbol.upper(), args.cost, args.quantity, args.market)
+    else:
+        portfolio.sell_stock(args.name, args.symbol.upper(), args.cost, args.quantity, args.market)
+
+
+def status(user, args):
+    from Portfolio import Portfolio
+    portfolio = Portfolio(user)
+    if args.date:
+        portfolio.portfolio_status_date(args.name, args.date)
+    else:
+        portfolio.portfolio_status(args.name)
+
+
+def period(user, args):
+    from Portfolio import Portfolio
+    Portfolio(user).portfolio_status_period(args.name, args.days)
+
+
+def parser():
+    parser = argparse.ArgumentParser(description="Track stock, crypto and commodity portfolios")
+    parser.add_argument("--user", default="Enes", help="user name, the database file is <user>.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="list the portfolios").set_defaults(handler=list_portfolios)
+
+    for command, handler, text in (("create", create_portfolio, "create a portfolio"),
+                                   ("delete", delete_portfolio, "delete a portfolio and its history")):
+        command_parser = commands.add_parser(command, help=text)
+        command_parser.add_argument("name")
+        command_parser.set_defaults(handler=handler)
+
+    for command in ("buy", "sell"):
+        command_parser = commands.add_parser(command, help=f"{command} a stock at the given price")
+        command_parser.add_argument("name")
+        command_parser.add_argument("symbol")
+        command_parser.add_argument("cost", type=float)
+        command_parser.add_argument("quantity", type=float)
+        command_parser.add_argument("market", choices=markets)
+        command_parser.set_defaults(handler=trade)
+
+    command_parser = commands.add_parser("status", help="value and profit/loss of a portfolio")
+    command_parser.add_argument("name")
+    command_parser.add_argument("--date", help="profit/loss of the trades since this date (YYYY-MM-DD)")
+    command_parser.set_defaults(handler=status)
+
+    command_parser = commands.add_parser("period", help="profit/loss over the last days")
+    command_parser.add_argument("name")
+    command_parser.add_argument("days", type=int)
+    command_parser.set_defaults(handler=period)
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    user = User(args.user)
+    try:
+        return args.handler(user, args) or 0  # Handlers return 1 when they printed an error themselves
+    except (ValueError, KeyError) as error:
+        # Unknown portfolio or missing price: print the message (e.g. "Portfolio not found: ...") instead of a traceback
+        print(error.args[0] if error.args else error)
+        return 1
+    finally:
+        user.close_conn()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
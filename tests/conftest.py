@@ -0,0 +1,33 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PriceProvider import LocalPriceProvider
+from QuoteCache import QuoteCache
+from Portfolio import Portfolio
+from User import User
+
+prices = {"THYAO.IS": 310.0, "AAPL": 200.0, "TSLA": 250.0, "BTC-USD": 80000.0, "TRY=X": 38.0, "EUR=X": 0.9}
+infos = {"THYAO.IS": {"longName": "Turk Hava", "exchange": "IST", "currency": "TRY"},
+         "AAPL": {"longName": "Apple", "exchange": "NMS", "currency": "USD"},
+         "TSLA": {"longName": "Tesla", "exchange": "NMS", "currency": "USD"},
+         "BTC-USD": {"longName": "Bitcoin", "exchange": "CCC", "currency": "USD"}}
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    # Every test gets its own database directory, a fresh quote cache and a LocalPriceProvider
+    monkeypatch.chdir(tmp_path)
+    provider = LocalPriceProvider(dict(prices), dict(infos), {})
+    Portfolio.use_provider(provider)
+    Portfolio.use_cache(QuoteCache())
+    return provider
+
+
+@pytest.fixture
+def user(offline):
+    user = User("Test")
+    yield user
+    user.conn.close()
@@ -0,0 +1,50 @@
+import asyncio
+import time
+from AsyncPriceEngine import AsyncPriceEngine, LocalAsyncPriceProvider
+from Portfolio import Portfolio
+from QuoteCache import QuoteCache
+
+prices = {f"S{i}": 10.0 + i for i in range(40)}
+
+
+def test_concurrency_cap(offline):
+    provider = LocalAsyncPriceProvider(prices, latency=0.02)
+    engine = AsyncPriceEngine(provider, Portfolio.get_extension, max_concurrency=5)
+    result = engine.get_prices_sync([(f"S{i}", "America") for i in range(40)])
+    assert result[("S39", "America")] == 49.0
+    assert provider.calls == 40
+    assert provider.max_in_flight == 5
+
+
+def test_requests_for_one_symbol_are_coalesced(offline):
+    provider = LocalAsyncPriceProvider(prices, latency=0.02)
+    engine = AsyncPriceEngine(provider, Portfolio.get_extension)
+
+    async def many():
+        return await asyncio.gather(*(engine.get_price("S1", "America") for i in range(20)))
+    assert asyncio.run(many()) == [11.0] * 20
+    assert provider.calls == 1
+
+
+def test_rate_limit(offline):
+    provider = LocalAsyncPriceProvider(prices)
+    engine = AsyncPriceEngine(provider, Portfolio.get_extension, rate=50, burst=1)
+    start = time.monotonic()
+    engine.get_prices_sync([(f"S{i}", "America") for i in range(11)])
+    assert time.monotonic() - start >= 0.18  # 10 requests after the first wait for a token, 20 ms each
+
+
+def test_async_valuation_does_not_call_the_sync_provider(offline, user):
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.buy_stock("p", "AAPL", 100, 10, "America")
+    portfolio.buy_stock("p", "THYAO", 300, 10, "BIST")
+    expected = portfolio.portfolio_infos("p", "EUR")
+
+    Portfolio.use_cache(QuoteCache())
+    provider = LocalAsyncPriceProvider(dict(offline.prices), latency=0.01)
+    Portfolio.use_async_engine(AsyncPriceEngine(provider, Portfolio.get_extension, cache=Portfolio.cache))
+    calls = offline.calls
+    assert asyncio.run(portfolio.portfolio_infos_async("p", "EUR")) == expected
+    assert offline.calls == calls
+    assert provider.calls == 4  # AAPL, THYAO.IS, TRY=X and EUR=X
@@ -0,0 +1,55 @@
+from _datetime import datetime, timedelta
+from Portfolio import Portfolio
+
+
+def test_cross_rates_from_the_base_pairs(offline, user):
+    fx = Portfolio(user).fx
+    assert fx.rate("USD", "TRY") == 38.0
+    assert abs(fx.rate("EUR", "TRY") - 38.0 / 0.9) < 1e-9
+    assert fx.rates_to("USD", ["TRY", "USD"]) == {"TRY": 1 / 38.0, "USD": 1.0}
+    assert abs(fx.convert([(100, "USD"), (380, "TRY"), (90, "EUR")], "USD") - 210.0) < 1e-9
+
+
+def test_daily_rates_use_the_previous_close(offline, user):
+    offline.history = {"TRY=X": {"2025-04-04": 38.0, "2025-04-07": 38.5}}
+    fx = Portfolio(user).fx
+    fx.preload("2025-04-04", "2025-04-08")
+    assert [fx.rate("USD", "TRY", date) for date in ("2025-04-04", "2025-04-05", "2025-04-06", "2025-04-07")] == [38.0, 38.0, 38.0, 38.5]
+
+
+def test_holding_without_a_currency_is_not_converted(offline, user, capsys):
+    offline.prices["XYZ"] = 5.0
+    offline.history = {"TRY=X": {(datetime.now() - timedelta(days=3)).strftime("%Y-%m-%d"): 38.0}}
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.buy_stock("p", "XYZ", 4, 10, "America")  # No info, stored with currency "Unknown"
+    portfolio.buy_stock("p", "AAPL", 100, 1, "America")
+    assert {row[0]: row[4] for row in portfolio.holdings("p")}["XYZ"] == "Unknown"
+
+    assert portfolio.portfolio_infos("p")["general"]["portfolio_value"] == 50.0 + 200.0 * 38.0
+    portfolio.portfolio_status("p")
+    portfolio.portfolio_status_date("p", "2025-01-01")
+    portfolio.portfolio_status_period("p", 7)
+    assert "No exchange rate found for Unknown" in capsys.readouterr().out
+
+
+def test_rate_downloads_do_not_cut_the_trade_stream(offline, user, capsys):
+    offline.history = {"TRY=X": {"2025-04-04": 38.0, "2025-04-07": 38.5, "2025-04-08": 39.0}}
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.import_trades("p", [("2025-04-04", "buy", "AAPL", 100, 1, "America"),
+                                  ("2025-04-07", "buy", "TSLA", 200, 1, "America"),
+                                  ("2025-04-08", "buy", "AAPL", 150, 1, "America")])
+    capsys.readouterr()
+    portfolio.portfolio_status_date("p", "2025-04-01")
+    expected = capsys.readouterr().out
+
+    # Every rate lookup finds no matrix and downloads through the shared cursor
+    rates_to = portfolio.fx.rates_to
+    def cold_rates_to(target, currencies, date=None):
+        portfolio.fx.matrices = {}
+        portfolio.user.cursor.execute("SELECT 1")
+        return rates_to(target, currencies, date)
+    portfolio.fx.rates_to = cold_rates_to
+    portfolio.portfolio_status_date("p", "2025-04-01")
+    assert capsys.readouterr().out == expected
@@ -0,0 +1,44 @@
+from Portfolio import Portfolio
+
+
+def test_dates_are_stored_zero_padded(offline, user):
+    offline.history = {"AAPL": {"2025-01-03": 100.0, "2025-01-06": 110.0, "2025-02-03": 120.0}, "TRY=X": {"2025-01-03": 35.0}}
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    result = portfolio.import_trades("p", [("2025-1-5", "buy", "AAPL", 100, 10, "America"),
+                                           ("2025-01-20", "sell", "AAPL", 150, 5, "America")])
+    assert result["imported"] == 2
+    user.cursor.execute("SELECT date FROM trades ORDER BY trade_id")
+    assert user.cursor.fetchall() == [("2025-01-05",), ("2025-01-20",)]
+    assert portfolio.realized_pl("p", "2025-01-01", "2025-01-31") == {"USD": 250.0}
+    portfolio.portfolio_status_date("p", "2025-01-01")
+
+
+def test_future_dates_are_rejected(offline, user):
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    result = portfolio.import_trades("p", [("2099-01-05", "buy", "AAPL", 100, 10, "America")])
+    assert result["imported"] == 0
+    assert "future" in result["rejected"][0][2]
+
+
+def test_rows_are_replayed_in_date_order(offline, user):
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    result = portfolio.import_trades("p", [("2025-03-01", "sell", "AAPL", 150, 5, "America"),
+                                           ("2025-02-01", "buy", "AAPL", 100, 10, "America")])
+    assert result["imported"] == 2
+    assert portfolio.holdings("p")[0][2:4] == (100.0, 5.0)
+    assert portfolio.realized_pl("p", "2025-01-01", "2025-12-31") == {"USD": 250.0}
+
+
+def test_sell_before_the_position_exists_is_rejected(offline, user):
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.import_trades("p", [("2025-03-01", "buy", "AAPL", 100, 10, "America")])
+    result = portfolio.import_trades("p", [("2025-02-01", "sell", "AAPL", 150, 5, "America")])
+    assert result["imported"] == 0
+    assert result["rejected"][0][2] == "Oversell: 0.0 lots of AAPL held on 2025-02-01"
+    assert portfolio.holdings("p")[0][3] == 10.0
+    user.cursor.execute("SELECT sum(quantity) FROM lots")
+    assert user.cursor.fetchone()[0] == 10.0
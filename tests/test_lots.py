@@ -0,0 +1,79 @@
+import pytest
+from _datetime import datetime
+from Portfolio import Portfolio
+
+today = datetime.now().strftime("%Y-%m-%d")
+
+
+def test_open_lots_follow_a_rollback(offline, user):
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.buy_stock("p", "AAPL", 100, 10, "America")
+
+    with pytest.raises(RuntimeError):
+        with user.transaction():
+            portfolio.buy_stock("p", "AAPL", 200, 10, "America")
+            raise RuntimeError
+
+    portfolio.sell_stock("p", "AAPL", 150, 5, "America")
+    assert portfolio.realized_pl("p", today, today) == {"USD": 250.0}
+    assert portfolio.holdings("p")[0][2] == 100
+
+
+def test_open_lots_of_a_deleted_portfolio(offline, user):
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.buy_stock("p", "AAPL", 100, 10, "America")
+    user.delete_the_portfolio("p")
+
+    user.create_new_portfolio("q")  # Gets the id of the deleted portfolio
+    portfolio.buy_stock("q", "AAPL", 300, 10, "America")
+    portfolio.sell_stock("q", "AAPL", 300, 5, "America")
+    assert portfolio.realized_pl("q", today, today) == {"USD": 0.0}
+    assert portfolio.holdings("q")[0][2] == 300
+
+
+def test_fifo_lifo_and_average_matching(offline, user):
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.buy_stock("p", "AAPL", 100, 10, "America")
+    portfolio.buy_stock("p", "AAPL", 200, 10, "America")
+    portfolio.buy_stock("p", "AAPL", 400, 10, "America")
+    portfolio.sell_stock("p", "AAPL", 300, 15, "America")
+
+    # Realized P/L of the sell and the cost of the 15 shares left
+    expected = {"fifo": (2500.0, 333.33), "lifo": (-500.0, 133.33), "average": (1000.0, 233.33)}
+    for method in ("fifo", "lifo", "average", "fifo"):
+        portfolio.set_cost_method("p", method)
+        pl, cost = expected[method]
+        assert portfolio.realized_pl("p", today, today) == {"USD": pl}
+        assert portfolio.holdings("p")[0][2:4] == (cost, 15.0)
+
+    # Matching continues from the partly sold lot
+    portfolio.sell_stock("p", "AAPL", 500, 10, "America")
+    assert portfolio.realized_pl("p", today, today) == {"USD": 2500.0 + 2000.0}
+    assert portfolio.holdings("p")[0][2:4] == (400.0, 5.0)
+
+
+def test_portfolios_on_one_user_share_the_open_lots(offline, user):
+    user.create_new_portfolio("p")
+    a = Portfolio(user)
+    b = Portfolio(user)
+    a.buy_stock("p", "AAPL", 100, 10, "America")
+    b.buy_stock("p", "AAPL", 200, 10, "America")
+    a.sell_stock("p", "AAPL", 300, 15, "America")
+
+    assert a.realized_pl("p", today, today) == {"USD": 2250.0}
+    assert a.holdings("p")[0][2:4] == (150.0, 5.0)
+    user.cursor.execute("SELECT sum(quantity) FROM lots")
+    assert user.cursor.fetchone()[0] == 5.0
+
+
+def test_holding_cost_is_kept_when_the_lots_do_not_cover_it(offline, user):
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.buy_stock("p", "AAPL", 100, 10, "America")
+    # A holding larger than its trade history, e.g. edited by hand or migrated without all trades
+    user.cursor.execute("UPDATE holdings SET quantity = 30, cost = 120")
+    portfolio.sell_stock("p", "AAPL", 300, 15, "America")
+    assert portfolio.holdings("p")[0][2:4] == (120.0, 15.0)
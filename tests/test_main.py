@@ -0,0 +1,18 @@
+import main
+
+
+def test_unknown_portfolio_prints_a_message(offline, capsys):
+    assert main.main(["--user", "Test", "status", "nope"]) == 1
+    assert "Portfolio not found: nope" in capsys.readouterr().out
+    assert main.main(["--user", "Test", "buy", "nope", "AAPL", "100", "1", "America"]) == 1
+    assert "Portfolio not found: nope" in capsys.readouterr().out
+    assert main.main(["--user", "Test", "delete", "nope"]) == 1
+    assert "Portfolio not found" in capsys.readouterr().out
+
+
+def test_commands_exit_with_zero(offline, capsys):
+    assert main.main(["--user", "Test", "create", "p"]) == 0
+    assert main.main(["--user", "Test", "buy", "p", "aapl", "100", "1", "America"]) == 0
+    assert main.main(["--user", "Test", "list"]) == 0
+    assert "p\n" in capsys.readouterr().out
+    assert main.main(["--user", "Test", "delete", "p"]) == 0
@@ -0,0 +1,50 @@
+import sqlite3 as sql
+from Portfolio import Portfolio
+from User import User
+
+legacy_trades = [("2025-04-04", "buy", "THYAO", "Turk Hava", "TRY", "TRY", 300.0, 10.0),
+                 ("2025-04-07", "buy", "THYAO", "Turk Hava", "TRY", "TRY", 320.0, 10.0),
+                 ("2025-04-07", "buy", "AAPL", "Apple", "USD", "USD", 180.0, 2.0),
+                 ("2025-04-08", "sell", "THYAO", "Turk Hava", "TRY", "TRY", 330.0, 5.0)]
+
+
+def legacy_database(name):
+    # Layout before the shared tables: a {portfolio} and a {portfolio}_trade_history table per portfolio
+    conn = sql.connect(f"{name}.db")
+    conn.execute("CREATE TABLE Growth (symbol TEXT, name TEXT, cost REAL, quantity REAL, exchange TEXT, market TEXT)")
+    conn.executemany("INSERT INTO Growth VALUES (?, ?, ?, ?, ?, ?)",
+                     [("THYAO", "Turk Hava", 310.0, 15.0, "TRY", "BIST"), ("AAPL", "Apple", 180.0, 2.0, "USD", "America")])
+    conn.execute("CREATE TABLE Growth_trade_history (date DATE, action TEXT, symbol TEXT, s_name TEXT, exchange TEXT, "
+                 "currency TEXT, cost REAL, quantity REAL)")
+    conn.executemany("INSERT INTO Growth_trade_history VALUES (?, ?, ?, ?, ?, ?, ?, ?)", legacy_trades)
+    conn.execute("CREATE TABLE Empty (symbol TEXT, name TEXT, cost REAL, quantity REAL, exchange TEXT, market TEXT)")
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_database_round_trip(offline, capsys):
+    legacy_database("Test")
+    user = User("Test")
+    assert "2 portfolios migrated" in capsys.readouterr().out
+    assert sorted(user.portfolios()) == ["Empty", "Growth"]
+    assert not [table for table in user.tables() if table.startswith(("Growth", "Empty"))]
+
+    portfolio = Portfolio(user)
+    assert sorted(portfolio.holdings("Growth")) == [("AAPL", "Apple", 180.0, 2.0, "USD", "America"),
+                                                    ("THYAO", "Turk Hava", 310.0, 15.0, "TRY", "BIST")]
+    assert portfolio.holdings("Empty") == []
+    user.cursor.execute("SELECT date, action, symbol, s_name, exchange, currency, cost, quantity FROM trades "
+                        "WHERE portfolio_id = ? ORDER BY trade_id", (user.portfolio_id("Growth"),))
+    assert user.cursor.fetchall() == legacy_trades
+
+    # The lots are built from the migrated trades, the average cost matches the legacy holding cost
+    assert portfolio.realized_pl("Growth", "2025-01-01", "2025-12-31") == {"TRY": 100.0}
+    assert portfolio.tax_report("Growth", 2025) == [{"symbol": "THYAO", "currency": "TRY", "quantity": 5.0, "proceeds": 1650.0,
+                                                     "cost_basis": 1550.0, "pl": 100.0}]
+
+    # A second start finds nothing left to migrate
+    user.close_conn()
+    user = User("Test")
+    assert "migrated" not in capsys.readouterr().out
+    assert sorted(Portfolio(user).holdings("Growth"))[1][3] == 15.0
+    user.conn.close()
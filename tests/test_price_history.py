@@ -0,0 +1,63 @@
+import pytest
+from Portfolio import Portfolio
+
+
+def test_history_download_joins_the_outer_transaction(offline, user):
+    offline.history = {"AAPL": {"2025-04-04": 190.0, "2025-04-07": 180.0, "2025-04-08": 185.0}}
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+
+    # The download inside the block must not commit the half done work, and must work inside a savepoint
+    with pytest.raises(RuntimeError):
+        with user.transaction():
+            user.cursor.execute("INSERT INTO portfolios (name) VALUES ('q')")
+            with user.transaction():
+                assert portfolio.history.close_on("AAPL", "America", "2025-04-06") == 190.0
+            raise RuntimeError
+    assert user.portfolios() == ["p"]
+    assert not user.conn.in_transaction
+
+    # Outside a transaction the bars are stored and committed
+    assert portfolio.history.close_on("AAPL", "America", "2025-04-08") == 185.0
+    assert not user.conn.in_transaction
+    calls = offline.calls
+    assert portfolio.history.stored_closes([("AAPL", "America")], "2025-04-07", "2025-04-08")[("AAPL", "America")] == [("2025-04-07", 180.0), ("2025-04-08", 185.0)]
+    assert portfolio.history.close_on("AAPL", "America", "2025-04-08") == 185.0
+    assert offline.calls == calls
+
+
+def test_instrument_lookup_inside_a_savepoint(offline, user):
+    portfolio = Portfolio(user)
+    with user.transaction():
+        with user.transaction():
+            assert portfolio.instruments.get("TSLA", "America")["currency"] == "USD"
+    assert not user.conn.in_transaction
+    portfolio.instruments.refresh()
+    user.cursor.execute("SELECT symbol FROM instruments")
+    assert user.cursor.fetchall() == [("TSLA",)]
+
+
+def test_failed_download_is_requested_again(offline, user):
+    portfolio = Portfolio(user)
+    with pytest.raises(KeyError):
+        portfolio.history.close_on("AAPL", "America", "2025-04-08")
+
+    offline.history = {"AAPL": {"2025-04-04": 190.0, "2025-04-07": 180.0}}  # The source recovered
+    assert portfolio.history.close_on("AAPL", "America", "2025-04-08") == 180.0
+
+
+def test_sell_downloads_the_instrument_outside_the_transaction(offline, user):
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.buy_stock("p", "AAPL", 100, 10, "America")
+    user.cursor.execute("DELETE FROM instruments")  # Like a migrated database
+    user.conn.commit()
+
+    get_info = offline.get_info
+    def get_info_without_lock(yf_symbol):
+        assert not user.conn.in_transaction
+        return get_info(yf_symbol)
+    offline.get_info = get_info_without_lock
+    Portfolio.cache.clear()
+    portfolio.sell_stock("p", "AAPL", 150, 5, "America")
+    assert portfolio.holdings("p")[0][3] == 5.0
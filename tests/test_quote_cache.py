@@ -0,0 +1,31 @@
+from Portfolio import Portfolio
+from QuoteCache import QuoteCache
+
+
+def test_repeat_lookup_of_a_large_portfolio_is_served_from_the_cache(offline):
+    pairs = [(f"S{i}", "America") for i in range(2000)]
+    offline.prices.update({symbol: 10.0 + i for i, (symbol, market) in enumerate(pairs)})
+    Portfolio.get_prices(pairs)
+    calls = offline.calls
+
+    assert Portfolio.get_prices(pairs)[("S1999", "America")] == 2009.0
+    assert offline.calls == calls
+    assert Portfolio.cache.stats()["misses"] == 2000
+
+
+def test_bounded_cache_keeps_a_batch_and_its_bound(offline):
+    Portfolio.use_cache(QuoteCache(maxsize=100))
+    pairs = [(f"S{i}", "America") for i in range(500)]
+    offline.prices.update({symbol: 1.0 for symbol, market in pairs})
+    assert len(Portfolio.get_prices(pairs)) == 500
+    assert Portfolio.cache.maxsize == 100
+    assert Portfolio.cache.stats()["size"] == 100
+
+    # Inside a batch nothing is evicted, the most recently used entries are kept afterwards
+    with Portfolio.cache.batch():
+        for i, pair in enumerate(pairs):
+            Portfolio.cache.set(("price",) + pair + (None,), float(i))
+        assert Portfolio.cache.get(("price", "S0", "America", None)) == 0.0
+    assert Portfolio.cache.stats()["size"] == 100
+    assert Portfolio.cache.get(("price", "S499", "America", None)) == 499.0
+    assert Portfolio.cache.get(("price", "S1", "America", None)) is None
@@ -0,0 +1,60 @@
+import math
+from _datetime import datetime, timedelta
+from Portfolio import Portfolio
+from Risk import Risk
+
+
+def daily_history(symbol_seed, days, weekdays_only=False):
+    # Deterministic closes for the last days, optionally only on weekdays like a stock exchange
+    history = {}
+    for offset in range(days + 1):
+        day = datetime.now() - timedelta(days=days - offset)
+        if weekdays_only and day.weekday() >= 5:
+            continue
+        history[day.strftime("%Y-%m-%d")] = 100 + 10 * math.sin(offset / (3 + symbol_seed)) + offset % (5 + symbol_seed)
+    return history
+
+
+def test_holding_without_history_is_left_out(offline, user):
+    offline.history = {"AAPL": daily_history(1, 120, True), "TSLA": daily_history(2, 120, True),
+                       "SPY": daily_history(3, 120, True), "TRY=X": daily_history(4, 120, True)}
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.buy_stock("p", "THYAO", 300, 10, "BIST")  # No history at all
+    portfolio.buy_stock("p", "AAPL", 150, 10, "America")
+    portfolio.buy_stock("p", "TSLA", 200, 5, "America")
+
+    risk = Risk(portfolio, "p", days=100)
+    assert risk.missing == ["THYAO"]
+    assert risk.symbols == ["AAPL", "TSLA"]
+    assert risk.returns.shape[1] == 2 and risk.returns.shape[0] > 50
+    assert risk.volatility()["buckets"]["portfolio"] > 0
+    assert risk.historical_var()["portfolio"] > 0
+    assert risk.beta() is not None
+    assert abs(risk.correlation()["matrix"][0][0] - 1.0) < 1e-9
+
+
+def test_beta_when_window_starts_on_a_weekend(offline, user):
+    # Crypto trades every day, the benchmark only on weekdays
+    offline.history = {"BTC-USD": daily_history(1, 120), "SPY": daily_history(2, 120, True),
+                       "TRY=X": daily_history(3, 120)}
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.buy_stock("p", "BTC", 70000, 0.1, "Crypto Market")
+
+    for days in range(88, 95):
+        risk = Risk(portfolio, "p", days=days)
+        assert risk.beta() is not None, days
+        assert len(risk.returns) == len(risk.benchmark_returns) > 50
+
+
+def test_monte_carlo_is_independent_of_workers(offline, user):
+    offline.history = {"AAPL": daily_history(1, 120, True), "TSLA": daily_history(2, 120, True),
+                       "SPY": daily_history(3, 120, True), "TRY=X": daily_history(4, 120, True)}
+    user.create_new_portfolio("p")
+    portfolio = Portfolio(user)
+    portfolio.buy_stock("p", "AAPL", 150, 10, "America")
+    portfolio.buy_stock("p", "TSLA", 200, 5, "America")
+
+    risk = Risk(portfolio, "p", days=100)
+    assert risk.monte_carlo_var(paths=6000, seed=3) == risk.monte_carlo_var(paths=6000, seed=3, workers=2)